@@ -0,0 +1,97 @@
+"""Микробенчмарк разбора входящего текста: маршрут и клавиатура ответа.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_dispatch.py [--repeat N]
+
+Сравнивает прежний разбор (проверки по спискам, перебор всех знаков зодиака
+с .lower() и сборка ReplyKeyboardMarkup на каждый ответ) с таблицей маршрутов
+bot.MESSAGE_ROUTES и собранными один раз клавиатурами. Печатает затраты CPU
+на один апдейт. Код выхода 1, если какая-то кнопка клавиатур не находит маршрут.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+
+# Прежний разбор из handle_message — эталон для сравнения скорости
+
+def legacy_dispatch(text):
+    if text in ["🔮 Погадать", "🎱 Гадание на шаре", "🃏 Таро", "♊ Гороскоп", "ℹ️ Помощь", "↩️ Назад"]:
+        if text == "🃏 Таро":
+            return bot.get_tarot_keyboard.__wrapped__()
+        if text == "♊ Гороскоп":
+            return bot.get_zodiac_keyboard.__wrapped__()
+        if text == "↩️ Назад":
+            return bot.get_main_keyboard.__wrapped__()
+        return None
+    if text in ["1️⃣ Одна карта", "3️⃣ Три карты"]:
+        return bot.get_tarot_keyboard.__wrapped__()
+    for sign_name, sign_info in bot.ZODIAC_SIGNS.items():
+        if isinstance(sign_info, dict) and 'emoji' in sign_info:
+            if sign_info['emoji'] in text or sign_name in text.lower():
+                return bot.get_zodiac_keyboard.__wrapped__()
+    return bot.get_main_keyboard.__wrapped__()
+
+
+KEYBOARDS = {
+    bot.show_tarot_menu: bot.get_tarot_keyboard,
+    bot.show_zodiac_menu: bot.get_zodiac_keyboard,
+    bot.show_main_menu: bot.get_main_keyboard,
+}
+
+
+def dispatch(text):
+    route = bot.MESSAGE_ROUTES.get(bot.route_key(text))
+    if route is None:
+        return bot.get_main_keyboard()
+    if route.func is bot.send_tarot_reading:
+        return bot.get_tarot_keyboard()
+    if route.func is bot.send_horoscope:
+        return bot.get_zodiac_keyboard()
+    keyboard = KEYBOARDS.get(route.args[0])
+    return keyboard() if keyboard else None
+
+
+def keyboard_labels():
+    labels = []
+    for keyboard in (bot.get_main_keyboard(), bot.get_tarot_keyboard(), bot.get_zodiac_keyboard()):
+        labels += [button.text for row in keyboard.keyboard for button in row]
+    return labels
+
+
+def measure(function, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            function(text)
+    return (time.perf_counter() - start) / (repeat * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    labels = keyboard_labels()
+    unrouted = [label for label in labels if bot.route_key(label) not in bot.MESSAGE_ROUTES]
+    # Кнопки, знаки и свободные темы примерно в той же пропорции, что и в живом трафике
+    texts = labels + ['любовь', 'что меня ждет на работе?', 'деньги', 'Скажи про мою кошку']
+
+    legacy = measure(legacy_dispatch, texts, args.repeat)
+    current = measure(dispatch, texts, args.repeat)
+    print(f"апдейтов в выборке: {len(texts)}, повторов: {args.repeat}")
+    print(f"прежний разбор:   {legacy * 1e6:8.2f} мкс на апдейт")
+    print(f"таблица маршрутов: {current * 1e6:7.2f} мкс на апдейт ({legacy / current:.0f}x)")
+    for label in unrouted:
+        print(f"нет маршрута для кнопки: {label}")
+    return 1 if unrouted else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
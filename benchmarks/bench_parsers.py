@@ -0,0 +1,153 @@
+"""Бенчмарк извлечения гороскопов на сохраненных страницах.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_parsers.py [--repeat N] [--update]
+
+Для каждой страницы из benchmarks/fixtures печатает время разбора и начало
+извлеченного текста и сверяет текст с файлом *.expected.txt. Для сравнения
+замеряется и прежний разбор через BeautifulSoup(html.parser).
+Код выхода 1, если текст хотя бы одной страницы разошелся с ожидаемым;
+--update перезаписывает ожидаемые тексты.
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+
+# Прежние реализации на BeautifulSoup — эталон для сравнения скорости и результата
+
+def legacy_horo_mail(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    selectors = [
+        '.article__text',
+        '.p-prediction__text',
+        '.article__item__text',
+        '.prediction__text',
+        '[class*="article"]',
+        '[class*="prediction"]'
+    ]
+    for selector in selectors:
+        for element in soup.select(selector):
+            text = element.get_text(strip=True)
+            if len(text) > 100 and any(word in text.lower() for word in ['сегодня', 'гороскоп', 'день', 'неделя']):
+                return re.sub(r'\s+', ' ', text)
+    return None
+
+
+def legacy_rambler(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    selectors = [
+        '.mvh__description',
+        '[data-cy="horoscope-description"]',
+        '.xN_sL',
+        '.h7qoQ',
+        '[class*="description"]',
+        '[class*="text"]'
+    ]
+    for selector in selectors:
+        for element in soup.select(selector):
+            text = element.get_text(strip=True)
+            if len(text) > 100:
+                return re.sub(r'\s+', ' ', text)
+    return None
+
+
+def legacy_with_fallback(content, selectors):
+    soup = BeautifulSoup(content, 'html.parser')
+    for selector in selectors:
+        element = soup.select_one(selector)
+        if element and element.get_text(strip=True):
+            text = element.get_text(strip=True)
+            if len(text) > 100:
+                return re.sub(r'\s+', ' ', text)
+    for container in soup.find_all(['div', 'section', 'article'], class_=True):
+        text = container.get_text(strip=True)
+        if len(text) > 200 and any(word in text.lower() for word in ['гороскоп', 'прогноз', 'сегодня']):
+            return re.sub(r'\s+', ' ', text)[:1000]
+    return None
+
+
+FALLBACK_SELECTORS = ['.horoscope__text', '.prediction-text']
+
+# (страница, новый разбор, прежний разбор или None)
+CASES = [
+    ('horo_mail.html', bot.extract_horo_mail, legacy_horo_mail),
+    ('rambler.html', bot.extract_rambler, legacy_rambler),
+    ('fallback.html',
+     lambda content: bot.extract_with_fallback(content, FALLBACK_SELECTORS),
+     lambda content: legacy_with_fallback(content, FALLBACK_SELECTORS)),
+    ('ignio_aries.xml', lambda content: bot.extract_ignio(content.decode('utf-8')), None),
+    # Через IGNIO_SIGNS, как в parse_ignio_feed: в эталоне — наш ключ знака и его собственный текст
+    ('ignio_com.xml',
+     lambda content: {bot.IGNIO_SIGNS[name]: text for name, text in bot.extract_ignio_feed(content).items()},
+     None),
+]
+
+
+def as_text(result):
+    if isinstance(result, dict):
+        return '\n'.join(f"{key}: {value}" for key, value in sorted(result.items()))
+    return result or ''
+
+
+def measure(func, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(content)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings) * 1000, sum(timings) / len(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--update', action='store_true', help='перезаписать *.expected.txt')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'страница':<18} {'размер':>8} {'мин, мс':>9} {'сред, мс':>9} {'прежний, мс':>12}  результат")
+    for name, extract, legacy in CASES:
+        path = FIXTURES / name
+        content = path.read_bytes()
+        result, best, mean = measure(extract, content, args.repeat)
+        text = as_text(result)
+
+        legacy_ms = ''
+        if legacy is not None:
+            _, legacy_best, _ = measure(legacy, content, max(args.repeat // 5, 1))
+            legacy_ms = f"{legacy_best:.2f}"
+
+        expected_path = path.with_name(path.stem + '.expected.txt')
+        if args.update:
+            expected_path.write_text(text + '\n', encoding='utf-8')
+            status = 'обновлено'
+        elif not expected_path.exists():
+            status = 'нет эталона'
+            failed = True
+        elif expected_path.read_text(encoding='utf-8').rstrip('\n') != text:
+            status = 'РАСХОЖДЕНИЕ'
+            failed = True
+        else:
+            status = 'ok'
+
+        preview = text.replace('\n', ' ')[:60]
+        print(f"{name:<18} {len(content):>8} {best:>9.2f} {mean:>9.2f} {legacy_ms:>12}  {status}: {preview}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Бенчмарк раскладов Таро.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_tarot.py [--count N] [--seed S]
+
+Печатает, сколько раскладов в секунду выдает TarotEngine для каждого расклада,
+и для сравнения — прежняя реализация (22 карты, list(...items()) на каждый
+расклад и форматирование всех пяти вариантов ответа ради одного).
+Проверяет, что два движка с одним seed выдают одинаковые расклады;
+код выхода 1, если это не так.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tarot import MAJOR_ARCANA, SPREADS, TarotEngine  # noqa: E402
+
+
+# Прежняя реализация из bot.py — эталон для сравнения скорости
+
+LEGACY_CARDS = {name: {'meaning': upright, 'image': image} for name, image, upright, _ in MAJOR_ARCANA}
+
+
+def legacy_draw(count=1):
+    return random.sample(list(LEGACY_CARDS.items()), count)
+
+
+def legacy_single(card):
+    name, info = card
+    interpretations = [
+        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nЭта карта указывает на важные энергии в твоей жизни сейчас. Прислушайся к интуиции!",
+        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nАркан приносит тебе послание свыше. Задумайся над его значением.",
+        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nКарта показывает ключевую тему твоего нынешнего пути.",
+        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nЭтот аркан раскрывает тайны твоей судьбы в данный момент.",
+        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nМудрость карты поможет тебе найти верное направление."
+    ]
+    return random.choice(interpretations)
+
+
+def legacy_three(cards):
+    past, present, future = cards
+    return (f"📜 **Расклад на три карты**\n\n"
+            f"🕰 **Прошлое:** {past[1]['image']} {past[0]}\n{past[1]['meaning']}\n\n"
+            f"⚡ **Настоящее:** {present[1]['image']} {present[0]}\n{present[1]['meaning']}\n\n"
+            f"🔮 **Будущее:** {future[1]['image']} {future[0]}\n{future[1]['meaning']}")
+
+
+def rate(function, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--seed', default='bench')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = TarotEngine(seed=args.seed)
+    print(f"подготовка текстов: {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    print(f"прежний, одна карта: {rate(lambda: legacy_single(legacy_draw(1)[0]), args.count):>12,.0f} раскладов/с")
+    print(f"прежний, три карты:  {rate(lambda: legacy_three(legacy_draw(3)), args.count):>12,.0f} раскладов/с")
+    for key in SPREADS:
+        print(f"движок, {key:<12} {rate(lambda: engine.read(key), args.count):>12,.0f} раскладов/с")
+
+    first, second = TarotEngine(seed=args.seed), TarotEngine(seed=args.seed)
+    reproducible = all(first.read(key) == second.read(key) for _ in range(100) for key in SPREADS)
+    print(f"воспроизводимость с seed={args.seed!r}: {'да' if reproducible else 'НЕТ'}")
+    return 0 if reproducible else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
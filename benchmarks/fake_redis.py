@@ -0,0 +1,146 @@
+"""Минимальный сервер с протоколом Redis (RESP) для локальных проверок.
+
+    python benchmarks/fake_redis.py [--port 6390] [--password secret]
+
+Поддерживает PING, AUTH, SELECT, GET, MGET, SET (EX/PX), DEL, SCAN (MATCH/COUNT), DBSIZE, FLUSHALL —
+ровно то, чем пользуется RedisBackend. Данные живут в памяти процесса, у каждой
+базы (SELECT) свои; с паролем команды без AUTH отклоняются, как в Redis.
+Можно запустить и из кода: server = await FakeRedis().start(port).
+"""
+import argparse
+import asyncio
+import fnmatch
+import time
+
+
+class Connection:
+    def __init__(self, authenticated):
+        self.authenticated = authenticated
+        self.db = 0
+
+
+class FakeRedis:
+    def __init__(self, password=None):
+        self.password = password
+        self.databases = {0: {}}
+        self.data = self.databases[0]
+        self.commands = 0
+        self.writers = set()
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    @staticmethod
+    def bulk(value):
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def execute(self, args, connection=None):
+        self.commands += 1
+        name = args[0].upper()
+        if connection is not None:
+            if name == b'AUTH':
+                connection.authenticated = args[1].decode() == self.password
+                return b'+OK\r\n' if connection.authenticated else b'-WRONGPASS invalid password\r\n'
+            if not connection.authenticated:
+                return b'-NOAUTH Authentication required.\r\n'
+            if name == b'SELECT':
+                connection.db = int(args[1])
+                return b'+OK\r\n'
+            self.data = self.databases.setdefault(connection.db, {})
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name in (b'AUTH', b'SELECT'):
+            return b'+OK\r\n'
+        if name == b'GET':
+            return self.bulk(self.get(args[1]))
+        if name == b'MGET':
+            return b'*%d\r\n' % (len(args) - 1) + b''.join(self.bulk(self.get(key)) for key in args[1:])
+        if name == b'SET':
+            expires_at = None
+            options = [arg.upper() for arg in args[3:]]
+            if b'EX' in options:
+                expires_at = time.time() + int(args[3 + options.index(b'EX') + 1])
+            if b'PX' in options:
+                expires_at = time.time() + int(args[3 + options.index(b'PX') + 1]) / 1000
+            self.data[args[1]] = (args[2], expires_at)
+            return b'+OK\r\n'
+        if name == b'DEL':
+            removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+            return b':%d\r\n' % removed
+        if name == b'SCAN':
+            options = [arg.upper() for arg in args[2:]]
+            pattern = args[2 + options.index(b'MATCH') + 1] if b'MATCH' in options else b'*'
+            count = int(args[2 + options.index(b'COUNT') + 1]) if b'COUNT' in options else 10
+            # Курсор — позиция в отсортированном списке ключей
+            cursor = int(args[1])
+            keys = sorted(self.data)
+            batch = [key for key in keys[cursor:cursor + count] if fnmatch.fnmatchcase(key, pattern) and self.get(key) is not None]
+            cursor = cursor + count if cursor + count < len(keys) else 0
+            return b'*2\r\n' + self.bulk(str(cursor).encode()) + b'*%d\r\n' % len(batch) + b''.join(map(self.bulk, batch))
+        if name == b'DBSIZE':
+            return b':%d\r\n' % len(self.data)
+        if name == b'FLUSHALL':
+            for data in self.databases.values():
+                data.clear()
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+    async def handle(self, reader, writer):
+        connection = Connection(authenticated=self.password is None)
+        self.writers.add(writer)
+        try:
+            while True:
+                args = await self.read_command(reader)
+                if args is None:
+                    break
+                writer.write(self.execute(args, connection))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    def drop_clients(self):
+        """Разрываем все соединения, как при перезапуске сервера"""
+        for writer in list(self.writers):
+            writer.close()
+
+    async def start(self, port, host='127.0.0.1'):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--password')
+    args = parser.parse_args()
+
+    server = await FakeRedis(args.password).start(args.port)
+    print(f"fake redis слушает 127.0.0.1:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
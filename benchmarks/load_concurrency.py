@@ -0,0 +1,130 @@
+"""Нагрузочный тест параллельной обработки апдейтов.
+
+Запуск из корня репозитория:
+
+    python benchmarks/load_concurrency.py [--updates N] [--chats N] [--latency СЕКУНДЫ]
+
+Через ChatOrderedUpdateProcessor прогоняется поток апдейтов от нескольких чатов.
+Обработчик имитирует медленный ответ (скрейпинг, Gemini) через asyncio.sleep.
+Для каждого уровня параллельности печатается пропускная способность и
+проверяется, что апдейты одного чата обработаны строго по порядку.
+
+Второй сценарий — «один занятый чат»: чат шлет подряд --busy-updates медленных
+апдейтов (--busy-latency, как долгое предсказание), а другие чаты — апдейты без
+работы. Их ожидание не должно зависеть от очереди занятого чата.
+Код выхода 1, если порядок нарушен или другие чаты ждали занятый.
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import sys
+import time
+from pathlib import Path
+
+from telegram import Chat, Message, Update, User
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from update_processor import ChatOrderedUpdateProcessor  # noqa: E402
+
+
+def make_update(update_id, chat_id):
+    user = User(id=chat_id, first_name='load', is_bot=False)
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(datetime.timezone.utc),
+        chat=Chat(id=chat_id, type=Chat.PRIVATE),
+        from_user=user,
+        text='🎱 Гадание на шаре'
+    )
+    return Update(update_id=update_id, message=message)
+
+
+async def run(concurrency, updates, latency):
+    processor = ChatOrderedUpdateProcessor(concurrency)
+    processed = {}
+
+    async def handle(update):
+        chat_id = update.effective_chat.id
+        # Разброс задержки, чтобы поздние апдейты чата могли «обогнать» ранние без блокировки
+        await asyncio.sleep(latency * random.uniform(0.5, 1.5))
+        processed.setdefault(chat_id, []).append(update.update_id)
+
+    async with processor:
+        start = time.perf_counter()
+        tasks = [
+            asyncio.create_task(processor.process_update(update, handle(update)))
+            for update in updates
+        ]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    ordered = all(ids == sorted(ids) for ids in processed.values())
+    return elapsed, ordered
+
+
+async def run_busy_chat(concurrency, busy_updates, busy_latency, other_chats):
+    """Сколько ждут апдейты других чатов, пока один чат занят очередью медленных апдейтов"""
+    processor = ChatOrderedUpdateProcessor(concurrency)
+    waits = []
+
+    async def handle(update, created):
+        if update.effective_chat.id == 0:
+            await asyncio.sleep(busy_latency)
+        else:
+            waits.append(time.perf_counter() - created)
+
+    async with processor:
+        tasks = []
+        for update_id in range(busy_updates):
+            update = make_update(update_id, 0)
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(update, time.perf_counter()))))
+        # Другие чаты пишут, когда очередь занятого чата уже выстроилась
+        await asyncio.sleep(0)
+        for chat_id in range(1, other_chats + 1):
+            update = make_update(busy_updates + chat_id, chat_id)
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(update, time.perf_counter()))))
+        await asyncio.gather(*tasks)
+    return max(waits)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=400)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--levels', default='1,4,16,64')
+    parser.add_argument('--busy-updates', type=int, default=6)
+    parser.add_argument('--busy-latency', type=float, default=0.5)
+    args = parser.parse_args()
+
+    random.seed(1)
+    updates = [make_update(i, random.randrange(args.chats)) for i in range(args.updates)]
+
+    print(f"апдейтов {args.updates}, чатов {args.chats}, задержка обработчика ~{args.latency * 1000:.0f} мс")
+    print(f"{'параллельность':>14} {'время, с':>9} {'апдейтов/с':>11}  порядок в чатах")
+    failed = False
+    for level in map(int, args.levels.split(',')):
+        elapsed, ordered = await run(level, updates, args.latency)
+        failed |= not ordered
+        print(f"{level:>14} {elapsed:>9.2f} {args.updates / elapsed:>11.1f}  {'ok' if ordered else 'НАРУШЕН'}")
+
+    print(
+        f"\nодин занятый чат: {args.busy_updates} апдейтов по ~{args.busy_latency * 1000:.0f} мс, "
+        f"остальные чаты без работы"
+    )
+    print(f"{'параллельность':>14} {'макс. ожидание других чатов, мс':>32}")
+    for level in map(int, args.levels.split(',')):
+        if level < 2:
+            continue
+        wait = await run_busy_chat(level, args.busy_updates, args.busy_latency, level - 1)
+        blocked = wait > args.busy_latency / 2
+        failed |= blocked
+        print(f"{level:>14} {wait * 1000:>32.1f}  {'ЖДАЛИ ЗАНЯТЫЙ ЧАТ' if blocked else 'ok'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
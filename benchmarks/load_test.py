@@ -0,0 +1,317 @@
+"""Нагрузочный тест бота целиком, без сети.
+
+Запуск из корня репозитория:
+
+    python benchmarks/load_test.py [--users N] [--updates N] [--mix tarot=3,ball=2,horoscope=3,prediction=2]
+
+Синтетические пользователи шлют апдейты в handle_message (кнопки уходят дальше
+в handle_button). Внешние сервисы подменены заглушками внутри процесса:
+
+- Bot API — настоящий ExtBot с SendScheduler, запросы которого принимает
+  httpx.MockTransport (--telegram-latency, --telegram-errors — доля ответов 429);
+- Gemini — модели model_router (--gemini-latency до первого фрагмента,
+  --gemini-chunks и --gemini-chunk-delay для потока, --gemini-errors);
+- horo.mail.ru, rambler и ignio — общий HTTP-клиент бота отдает страницы из
+  benchmarks/fixtures (--site-latency, --site-errors — доля ответов 503).
+
+Задержки заглушек случайны в пределах ±50% от заданной. Печатает пропускную
+способность и p50/p95/p99 задержки обработки апдейта для каждого сценария,
+а также счетчики заглушек и бота. Лимиты отправки по умолчанию сняты, чтобы
+мерить сам бот; боевые значения — --global-rate 30 --chat-rate 1.
+Код выхода 1, если обработчик хотя бы раз завершился исключением.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import random
+import sys
+import time
+import types
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+from telegram import Update
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+from send_scheduler import SendScheduler  # noqa: E402
+
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+TOKEN = '123456:LOAD-TEST'
+PREDICTION_TOPICS = ('любовь', 'работа', 'деньги', 'что меня ждет завтра?', 'переезд', 'моя кошка')
+
+
+def jittered(rng, latency):
+    return latency * rng.uniform(0.5, 1.5) if latency > 0 else 0
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class FakeTelegram:
+    """Bot API: sendMessage и editMessageText возвращают сообщение, остальное — True"""
+
+    def __init__(self, rng, latency, error_rate):
+        self.rng = rng
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = collections.Counter()
+        self.message_ids = 0
+
+    async def handle(self, request):
+        method = request.url.path.rsplit('/', 1)[-1]
+        self.calls[method] += 1
+        await asyncio.sleep(jittered(self.rng, self.latency))
+        if method != 'getMe' and self.rng.random() < self.error_rate:
+            self.calls['429'] += 1
+            return httpx.Response(429, json={
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1}
+            })
+
+        data = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Гадалка', 'username': 'load_test_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            self.message_ids += 1
+            result = {
+                'message_id': int(data.get('message_id', self.message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': int(data['chat_id']), 'type': 'private'},
+                'text': data.get('text', '')
+            }
+        else:
+            result = True
+        return httpx.Response(200, json={'ok': True, 'result': result})
+
+
+class FakeStream:
+    def __init__(self, gemini):
+        self.gemini = gemini
+
+    def __aiter__(self):
+        return self.chunks()
+
+    async def chunks(self):
+        for index in range(self.gemini.chunks):
+            if index:
+                await asyncio.sleep(jittered(self.gemini.rng, self.gemini.chunk_delay))
+            yield types.SimpleNamespace(text=f"Звезды шепчут: часть {index + 1}. ", usage_metadata=None)
+
+
+class FakeGemini:
+    """Модель Gemini: ответ через latency секунд, доля error_rate запросов падает"""
+
+    def __init__(self, rng, latency, chunks, chunk_delay, error_rate):
+        self.rng = rng
+        self.latency = latency
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+
+    async def generate_content_async(self, request, stream=False):
+        self.calls += 1
+        await asyncio.sleep(jittered(self.rng, self.latency))
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise RuntimeError("503 заглушка Gemini недоступна")
+        if stream:
+            return FakeStream(self)
+        return types.SimpleNamespace(text="Звезды шепчут: все будет хорошо. " * self.chunks, usage_metadata=None)
+
+    async def count_tokens_async(self, text):
+        return types.SimpleNamespace(total_tokens=bot.estimate_tokens(text))
+
+
+class FakeSites:
+    """Сайты гороскопов: сохраненные страницы из benchmarks/fixtures"""
+
+    def __init__(self, rng, latency, error_rate):
+        self.rng = rng
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = collections.Counter()
+        self.pages = {
+            'horo.mail.ru': (FIXTURES / 'horo_mail.html').read_bytes(),
+            'horoscopes.rambler.ru': (FIXTURES / 'rambler.html').read_bytes(),
+            'ignio.com': (FIXTURES / 'ignio_aries.xml').read_bytes(),
+            'feed': (FIXTURES / 'ignio_com.xml').read_bytes(),
+        }
+
+    async def handle(self, request):
+        host = request.url.host
+        self.calls[host] += 1
+        await asyncio.sleep(jittered(self.rng, self.latency))
+        if self.rng.random() < self.error_rate:
+            self.calls['503'] += 1
+            return httpx.Response(503)
+        page = self.pages['feed'] if request.url.path.endswith('/com.xml') else self.pages.get(host)
+        if page is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=page)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий {name}, есть: {', '.join(FLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def tarot_flow(rng):
+    return [('tarot', rng.choice(list(bot.TAROT_BUTTONS)))]
+
+
+def ball_flow(rng):
+    return [('ball', "🎱 Гадание на шаре")]
+
+
+def horoscope_flow(rng):
+    sign = rng.choice(list(bot.ZODIAC_SIGNS))
+    return [('horoscope', f"{bot.ZODIAC_SIGNS[sign]['emoji']} {sign.capitalize()}")]
+
+
+def prediction_flow(rng):
+    return [('menu', "🔮 Погадать"), ('prediction', rng.choice(PREDICTION_TOPICS))]
+
+
+FLOWS = {
+    'tarot': tarot_flow,
+    'ball': ball_flow,
+    'horoscope': horoscope_flow,
+    'prediction': prediction_flow,
+}
+
+
+class LoadTest:
+    def __init__(self, args, tg_bot):
+        self.args = args
+        self.bot = tg_bot
+        self.rng = random.Random(args.seed)
+        self.update_ids = 0
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def make_update(self, user_id, text):
+        self.update_ids += 1
+        return Update.de_json({
+            'update_id': self.update_ids,
+            'message': {
+                'message_id': self.update_ids,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'load'},
+                'text': text
+            }
+        }, self.bot)
+
+    async def user(self, user_id, flows):
+        context = types.SimpleNamespace(bot=self.bot, user_data={}, chat_data={})
+        names, weights = zip(*self.args.mix.items())
+        for _ in range(flows):
+            flow = FLOWS[self.rng.choices(names, weights)[0]]
+            for name, text in flow(self.rng):
+                update = self.make_update(user_id, text)
+                start = time.perf_counter()
+                try:
+                    await bot.handle_message(update, context)
+                except Exception as e:
+                    self.errors[f"{name}: {type(e).__name__}: {e}"] += 1
+                self.latencies[name].append(time.perf_counter() - start)
+                if self.args.think:
+                    await asyncio.sleep(jittered(self.rng, self.args.think))
+
+    async def run(self):
+        flows, extra = divmod(self.args.updates, self.args.users)
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            self.user(1000 + index, flows + (index < extra))
+            for index in range(self.args.users)
+        ))
+        return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--updates', type=int, default=2000, help='сценариев на всех пользователей')
+    parser.add_argument('--mix', type=parse_mix, default='tarot=3,ball=2,horoscope=3,prediction=2')
+    parser.add_argument('--think', type=float, default=0, help='пауза пользователя между апдейтами, с')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--telegram-errors', type=float, default=0)
+    parser.add_argument('--gemini-latency', type=float, default=1.0)
+    parser.add_argument('--gemini-chunks', type=int, default=5)
+    parser.add_argument('--gemini-chunk-delay', type=float, default=0.3)
+    parser.add_argument('--gemini-errors', type=float, default=0.02)
+    parser.add_argument('--site-latency', type=float, default=0.3)
+    parser.add_argument('--site-errors', type=float, default=0.05)
+    parser.add_argument('--global-rate', type=float, default=10000)
+    parser.add_argument('--chat-rate', type=float, default=1000)
+    parser.add_argument('--verbose', action='store_true', help='не скрывать журнал бота')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    telegram = FakeTelegram(rng, args.telegram_latency, args.telegram_errors)
+    gemini = FakeGemini(rng, args.gemini_latency, args.gemini_chunks, args.gemini_chunk_delay, args.gemini_errors)
+    sites = FakeSites(rng, args.site_latency, args.site_errors)
+
+    bot.send_scheduler = SendScheduler(global_rate=args.global_rate, chat_rate=args.chat_rate,
+                                       chat_burst=max(5, args.chat_rate))
+    bot.model_router.models = {name: gemini for name in bot.model_router.health}
+    bot.token_counter = gemini
+    bot.http_client = httpx.AsyncClient(transport=httpx.MockTransport(sites.handle), follow_redirects=True)
+    tg_bot = ExtBot(
+        TOKEN,
+        request=HTTPXRequest(httpx_kwargs={'transport': httpx.MockTransport(telegram.handle)}),
+        rate_limiter=bot.send_scheduler
+    )
+    await tg_bot.initialize()
+
+    test = LoadTest(args, tg_bot)
+    try:
+        elapsed = await test.run()
+    finally:
+        await tg_bot.shutdown()
+        await bot.close_http_client(None)
+
+    total = sum(len(values) for values in test.latencies.values())
+    print(f"пользователей {args.users}, апдейтов {total} за {elapsed:.1f} с: {total / elapsed:.1f} апдейтов/с")
+    print(f"{'сценарий':<12}{'апдейтов':>9}{'в секунду':>11}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, values in sorted(test.latencies.items()):
+        print(
+            f"{name:<12}{len(values):>9}{len(values) / elapsed:>11.1f}"
+            f"{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}"
+        )
+
+    print(f"\nBot API: {json.dumps(dict(telegram.calls), ensure_ascii=False)}")
+    print(f"Gemini: запросов {gemini.calls}, ошибок {gemini.errors}")
+    print(f"Сайты гороскопов: {json.dumps(dict(sites.calls), ensure_ascii=False)}")
+    print(f"Кэш гороскопов: {json.dumps(bot.horoscope_stats, ensure_ascii=False)}")
+    print(f"Модели: {json.dumps(bot.model_router.counters, ensure_ascii=False)}")
+    print(f"Очередь Gemini: отказов {bot.prediction_gate.rejected}")
+    print(f"Отправка: {json.dumps(bot.send_scheduler.counters, ensure_ascii=False)}")
+    for error, count in test.errors.most_common():
+        print(f"исключение в обработчике ({count} раз): {error}")
+    return 1 if test.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,67 @@
+"""Отправка записанных апдейтов на локальный вебхук.
+
+Запуск из корня репозитория (сервер уже запущен: uvicorn webhook:app):
+
+    python benchmarks/post_updates.py benchmarks/fixtures/update_*.json [--repeat N] [--concurrency N]
+
+Каждый апдейт отправляется repeat раз с новым update_id и разными чатами.
+Печатает коды ответов и задержку подтверждения (p50/p95/max).
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', type=Path)
+    parser.add_argument('--url', default='http://127.0.0.1:8000' + os.getenv('WEBHOOK_PATH', '/telegram'))
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET'))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+
+    templates = [json.loads(path.read_text(encoding='utf-8')) for path in args.files]
+    payloads = []
+    for i in range(args.repeat):
+        for template in templates:
+            payload = copy.deepcopy(template)
+            payload['update_id'] += len(payloads)
+            message = payload.get('message')
+            if message and i:
+                message['chat']['id'] += i
+                message['from']['id'] += i
+            payloads.append(payload)
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret} if args.secret else {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses = {}
+    latencies = []
+
+    async with httpx.AsyncClient(headers=headers, timeout=10) as client:
+        async def post(payload):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(args.url, json=payload)
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(*(post(payload) for payload in payloads))
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+    print(f"отправлено {len(payloads)}, ответы {statuses}")
+    print(f"подтверждение: p50 {p50:.1f} мс, p95 {p95:.1f} мс, max {latencies[-1] * 1000:.1f} мс")
+    return 0 if set(statuses) == {200} else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -1,14 +1,46 @@
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
-import google.generativeai as genai
+from startup_profile import StartupProfile
+
+# Клиент Gemini (google.generativeai с grpc и protobuf) здесь не импортируется:
+# см. load_gemini_models — он загружается в фоне уже после старта бота
+startup_profile = StartupProfile()
+
+with startup_profile.measure('telegram'):
+    from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
+    from telegram.constants import ChatAction, MessageLimit
+    from telegram.error import TelegramError
+    from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+with startup_profile.measure('скрейпинг'):
+    import httpx
+    import lxml.html
+    from lxml import etree
 import os
-import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+import asyncio
+import importlib.util
 import logging
 import random
 import datetime
+import functools
+import io
 import re
+import time
+import xml.etree.ElementTree as ET
+
+from horoscope_store import HoroscopeStore
+from prediction_gate import PredictionGate
+from prediction_pool import PredictionPool
+from model_router import ModelRouter
+from send_scheduler import SendScheduler
+from tarot import TarotEngine
+from metrics import MetricsRegistry, timed
+from session_store import SessionStore
+from state_backend import StateStore, create_backend
+from update_processor import ChatOrderedUpdateProcessor
+from source_pool import SourcePool
+from health_monitor import HealthMonitor
+from runtime_profiler import RuntimeProfiler, counted
 
 
 logging.basicConfig(
@@ -17,20 +49,179 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-user_sessions = {}
 MAX_HISTORY = 15
 load_dotenv()
 
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-model = genai.GenerativeModel('gemini-2.5-pro')
+# Общее состояние (истории, ожидание темы, гороскопы): memory://, sqlite:///state.db или redis://host:6379/0.
+# С sqlite или redis несколько процессов бота (например, воркеры вебхука) видят одно и то же состояние
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory://')
+with startup_profile.measure('состояние'):
+    state = StateStore(
+        create_backend(STATE_BACKEND, max_keys=int(os.getenv('STATE_MAX_KEYS', '20000'))),
+        cache_ttl=float(os.getenv('STATE_CACHE_TTL', '60'))
+    )
+
+# Истории диалогов: после SESSION_IDLE_TTL секунд простоя забываем
+SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', '86400'))
+user_sessions = SessionStore(state, idle_ttl=SESSION_IDLE_TTL, max_turns=MAX_HISTORY * 2)
+
+def awaiting_topic_key(user_id):
+    """Ключ флага «следующее сообщение — тема для предсказания»"""
+    return f"topic:{user_id}"
+
+# Инструкция передается модели один раз как системная, а не повторяется в каждой реплике
+PREDICTION_INSTRUCTION = "Сгенерируй загадочное и немного шутливое предсказание на тему, которую напишет пользователь. Всегда выдавай один большой вариант ответа(старайся давать ответы до 1000 символов, но использовать их все). И избегай таких предложений 'вот держи' и ему подобных. Выдавай пользователю сразу предсказание"
+
+# В запрос попадают самые свежие реплики истории, которые укладываются в GEMINI_HISTORY_TOKENS токенов
+GEMINI_HISTORY_TOKENS = int(os.getenv('GEMINI_HISTORY_TOKENS', '4000'))
+TOKEN_COUNT_TIMEOUT = 2
+
+# Основная модель и запасная быстрая (пустое GEMINI_FALLBACK_MODEL — без запасной).
+# Ответ ждем не дольше GEMINI_DEADLINE секунд; если основная модель молчит дольше
+# GEMINI_HEDGE_DELAY (или своего p90), параллельно спрашиваем запасную
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-pro')
+GEMINI_FALLBACK_MODEL = os.getenv('GEMINI_FALLBACK_MODEL', 'gemini-2.5-flash')
+# Модели создаются не при импорте, а через GEMINI_WARMUP_DELAY секунд после старта
+# (или раньше, если предсказание попросят до этого)
+GEMINI_WARMUP_DELAY = float(os.getenv('GEMINI_WARMUP_DELAY', '5'))
+# Счетчик токенов без системной инструкции: считаем только текст реплики.
+# Пока модели не загружены, токены оцениваются по длине текста
+token_counter = None
+
+def load_gemini_models():
+    """Импорт и настройка клиента Gemini; выполняется в отдельном потоке"""
+    global token_counter
+    with startup_profile.measure('gemini'):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        models = {
+            name: genai.GenerativeModel(name, system_instruction=PREDICTION_INSTRUCTION)
+            for name in (GEMINI_MODEL, GEMINI_FALLBACK_MODEL) if name
+        }
+        token_counter = genai.GenerativeModel(GEMINI_MODEL)
+    logger.info(f"Клиент Gemini загружен за {startup_profile.steps['gemini']:.2f} с")
+    return models
+
+model_router = ModelRouter(
+    load_gemini_models,
+    primary=GEMINI_MODEL,
+    fallback=GEMINI_FALLBACK_MODEL or None,
+    deadline=float(os.getenv('GEMINI_DEADLINE', '30')),
+    hedge_delay=float(os.getenv('GEMINI_HEDGE_DELAY', '10')),
+    degraded_latency=float(os.getenv('GEMINI_DEGRADED_LATENCY', '20'))
+)
+
+# Не больше GEMINI_MAX_CONCURRENCY запросов к модели одновременно и GEMINI_QUEUE_SIZE в очереди
+prediction_gate = PredictionGate(
+    max_concurrency=int(os.getenv('GEMINI_MAX_CONCURRENCY', '4')),
+    max_queue=int(os.getenv('GEMINI_QUEUE_SIZE', '20'))
+)
+
+# Потоковый ответ: сообщение «Думаю...» обновляется не чаще раза в STREAM_EDIT_INTERVAL секунд
+GEMINI_STREAM = os.getenv('GEMINI_STREAM', '1') == '1'
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+
+# Пул готовых предсказаний для популярных тем: до PREDICTION_POOL_SIZE на тему (0 — пул выключен),
+# не старше PREDICTION_POOL_MAX_AGE секунд. Пополняется раз в PREDICTION_POOL_REFILL_INTERVAL секунд,
+# пока нет запросов пользователей к модели
+PREDICTION_POOL_TOPICS = os.getenv('PREDICTION_POOL_TOPICS', 'любовь,работа,деньги,здоровье,учеба,семья')
+PREDICTION_POOL_SIZE = int(os.getenv('PREDICTION_POOL_SIZE', '5'))
+PREDICTION_POOL_MAX_AGE = float(os.getenv('PREDICTION_POOL_MAX_AGE', '86400'))
+PREDICTION_POOL_REFILL_INTERVAL = float(os.getenv('PREDICTION_POOL_REFILL_INTERVAL', '900'))
+prediction_pool = PredictionPool(
+    topics=[topic.strip() for topic in PREDICTION_POOL_TOPICS.split(',') if topic.strip()],
+    size=PREDICTION_POOL_SIZE,
+    max_age=PREDICTION_POOL_MAX_AGE,
+    is_idle=lambda: not prediction_gate.users
+)
+
+# Апдейты разных чатов обрабатываются параллельно, одного чата — по порядку; 1 — строго по одному
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+
+# Исходящие запросы к Bot API: не больше SEND_GLOBAL_RATE в секунду на бота
+# и SEND_CHAT_RATE в секунду на личный чат, с учетом retry_after от Telegram
+send_scheduler = SendScheduler(
+    global_rate=float(os.getenv('SEND_GLOBAL_RATE', '30')),
+    chat_rate=float(os.getenv('SEND_CHAT_RATE', '1'))
+)
+
+# Метрики в формате Prometheus: GET http://METRICS_HOST:METRICS_PORT/metrics; METRICS_PORT=0 — выключено
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+metrics = MetricsRegistry()
+metrics_server = None
+handler_seconds = metrics.histogram('bot_handler_seconds', 'Время обработки апдейта обработчиком')
+source_seconds = metrics.histogram('bot_horoscope_source_seconds', 'Время загрузки и разбора гороскопа с сайта')
+source_failures = metrics.counter('bot_horoscope_source_failures_total', 'Неудачные загрузки гороскопа с сайта')
+gemini_seconds = metrics.histogram(
+    'bot_gemini_seconds', 'Время ответа Gemini (для потока — до первого фрагмента)'
+)
+
+# Администраторы (id через запятую): им доступна команда /profile
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
+# Профилирование по /profile длится не дольше PROFILE_MAX_SECONDS секунд
+runtime_profiler = RuntimeProfiler(max_seconds=float(os.getenv('PROFILE_MAX_SECONDS', '300')))
+
+# Общий HTTP-клиент для всех парсеров
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '4'))
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
+}
+
+http_client = None
+host_semaphores = {}
 
 
+# Кэш подменяется целиком (см. store_horoscopes), поэтому читатели всегда видят согласованный день
 horoscope_cache = {
     'date': None,
-    'horoscope': {}
-
+    'horoscopes': {}
 }
 
+# Последний известный гороскоп прошлых дней {знак: (дата, текст)} для stale-while-revalidate;
+# тексты старше HOROSCOPE_STALE_DAYS дней не показываем — вместо них запасной гороскоп
+horoscope_stale = {}
+HOROSCOPE_STALE_DAYS = int(os.getenv('HOROSCOPE_STALE_DAYS', '1'))
+
+# Гороскопы на диске переживают перезапуск бота
+HOROSCOPE_DB_PATH = os.getenv('HOROSCOPE_DB_PATH', 'horoscopes.db')
+HOROSCOPE_KEEP_DAYS = 7
+horoscope_store = None
+# В общем хранилище гороскоп живет двое суток: этого хватает и на смену дня в другом часовом поясе
+HOROSCOPE_STATE_TTL = 2 * 24 * 3600
+
+# Запросы к сайтам, которые уже выполняются (single-flight), и счетчики кэша
+horoscope_inflight = {}
+horoscope_stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'fetches': 0, 'stale': 0, 'backoff': 0}
+# После неудачной загрузки знака запросы пользователей не ходят на сайты до срока повтора:
+# {знак: (неудач подряд, time.monotonic() следующей попытки)}; срок удваивается с каждой неудачей
+horoscope_backoff = {}
+HOROSCOPE_RETRY_DELAY = 30
+HOROSCOPE_RETRY_MAX_DELAY = 600
+
+# Адаптивный выбор источников с хеджированием и предохранителями
+source_pool = SourcePool(
+    hedge_percentile=float(os.getenv('SOURCE_HEDGE_PERCENTILE', '0.9')),
+    hedge_delay=float(os.getenv('SOURCE_HEDGE_DELAY', '2')),
+    max_hedge_delay=HTTP_TIMEOUT,
+    failure_threshold=int(os.getenv('SOURCE_FAILURE_THRESHOLD', '3')),
+    cooldown=float(os.getenv('SOURCE_COOLDOWN', '300'))
+)
+
+# Ежедневный прогрев кэша гороскопов
+HOROSCOPE_TIMEZONE = ZoneInfo(os.getenv('HOROSCOPE_TIMEZONE', 'Europe/Moscow'))
+HOROSCOPE_PREFETCH_TIME = os.getenv('HOROSCOPE_PREFETCH_TIME', '00:05')
+PREFETCH_RETRY_DELAY = 60
+PREFETCH_RETRY_MAX_DELAY = 3600
+
+# Общая лента ignio со всеми знаками: один запрос вместо двенадцати при прогреве
+IGNIO_FEED_URL = os.getenv('IGNIO_FEED_URL', 'https://ignio.com/r/export/utf/xml/daily/com.xml')
+IGNIO_BULK = os.getenv('IGNIO_BULK', '1') == '1'
+
 ZODIAC_SIGNS = {
     'овен': {
         'emoji': '♈',
@@ -130,6 +321,14 @@ ZODIAC_SIGNS = {
     }
 }
 
+# Английские названия знаков в лентах ignio -> наши ключи
+IGNIO_SIGNS = {
+    url.rsplit('/', 1)[-1].removesuffix('.xml'): sign
+    for sign, info in ZODIAC_SIGNS.items()
+    for url in info['sources']
+    if 'ignio.com' in url
+}
+
 BACKUP_HOROSCOPES = {
     'овен': "Сегодня звезды советуют Овнам проявить инициативу. Отличный день для новых начинаний!",
     'телец': "Тельцам сегодня стоит сосредоточиться на финансовых вопросах. Будьте практичны и рассудительны.",
@@ -146,42 +345,92 @@ BACKUP_HOROSCOPES = {
 }
 
 
-TAROT_CARDS = {
-    "Шут": {"meaning": "Начало чего-то нового. Не бойся рисковать!", "image": "🃏"},
-    "Маг": {"meaning": "У тебя есть все необходимое для успеха. Действуй!", "image": "🪄"},
-    "Верховная Жрица": {"meaning": "Доверяй своей интуиции. Твой внутренний голос знает ответ.", "image": "🌙"},
-    "Императрица": {"meaning": "Плодородие и изобилие. Твои усилия принесут результаты.", "image": "👑"},
-    "Император": {"meaning": "Стабильность и контроль. Пора принимать важные решения.", "image": "⚜️"},
-    "Иерофант": {"meaning": "Ищи мудрых советников. Обучение и традиции помогут тебе.", "image": "📖"},
-    "Влюбленные": {"meaning": "Перед тобой важный выбор. Слушай свое сердце.", "image": "💑"},
-    "Колесница": {"meaning": "Двигайся вперед к своей цели. Успех в путешествиях.", "image": "🛡️"},
-    "Сила": {"meaning": "Ты сильнее, чем думаешь. Смелость победит любые страхи.", "image": "🦁"},
-    "Отшельник": {"meaning": "Время для размышлений. Побыть одному - это хорошо.", "image": "🧙"},
-    "Колесо Фортуны": {"meaning": "Удача на твоей стороне. Жди приятных сюрпризов.", "image": "🎡"},
-    "Справедливость": {"meaning": "Все будет по справедливости. Правда восторжествует.", "image": "⚖️"},
-    "Повешенный": {"meaning": "Взгляни на ситуацию по-новому. Иногда нужно просто отпустить.", "image": "🙃"},
-    "Смерть": {"meaning": "Конец одного и начало другого. Перемены - это хорошо.", "image": "💀"},
-    "Умеренность": {"meaning": "Соблюдай баланс во всем. Не торопись.", "image": "⚗️"},
-    "Дьявол": {"meaning": "Осторожнее с вредными привычками. Не попадись в ловушку.", "image": "😈"},
-    "Башня": {"meaning": "Неожиданные изменения. Старое должно уйти, чтобы пришло новое.", "image": "🏰"},
-    "Звезда": {"meaning": "Надежда и вера в лучшее. Твои мечты сбудутся.", "image": "⭐"},
-    "Луна": {"meaning": "Не все так, как кажется. Доверяй своим чувствам.", "image": "🌕"},
-    "Солнце": {"meaning": "Радость и успех. Все будет хорошо!", "image": "☀️"},
-    "Суд": {"meaning": "Время подвести итоги. Пришло время для новых начинаний.", "image": "👼"},
-    "Мир": {"meaning": "Гармония и завершение. Ты на правильном пути.", "image": "🌍"}
+# Таро: 78 карт с перевернутыми положениями; TAROT_SEED делает расклады воспроизводимыми (для проверок)
+with startup_profile.measure('таро'):
+    tarot = TarotEngine(
+        reversed_chance=float(os.getenv('TAROT_REVERSED_CHANCE', '0.3')),
+        seed=os.getenv('TAROT_SEED') or None
+    )
+
+# Кнопки раскладов Таро и ключи раскладов в tarot.SPREADS
+TAROT_BUTTONS = {
+    "1️⃣ Одна карта": 'one',
+    "3️⃣ Три карты": 'three',
+    "✝️ Кельтский крест": 'celtic',
 }
 
-def get_session():
-    """Создаем сессию с правильными заголовками"""
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-        'Accept-Encoding': 'gzip, deflate, br',
-    })
-    return session
+MAGIC_BALL_ANSWERS = (
+    "Знаки говорят — да! ✅",
+    "Мои кристаллы показывают — нет ❌",
+    "Шансы невелики... но все возможно 🌙",
+    "Определенно да! 🌟",
+    "Лучше не стоит 🚫",
+    "Да, но будь осторожен ⚠️",
+    "Нет, и это к лучшему 💫"
+)
+
+HELP_TEXT = (
+    "Я могу:\n"
+    "🔮 Погадать - гадание на любую тему\n"
+    "🎱 Гадание на шаре - простой ответ да/нет\n"
+    "🃏 Таро - гадание на картах Таро (1 карта, 3 карты или кельтский крест)\n"
+    "♊ Гороскоп - ежедневный гороскоп по знаку зодиака\n\n"
+    "Просто выбери нужный вариант на клавиатуре!"
+)
+
+def get_http_client():
+    """Общий клиент с пулом соединений: keep-alive и HTTP/2, если установлен h2"""
+    global http_client
+    if http_client is None or http_client.is_closed:
+        http_client = httpx.AsyncClient(
+            headers=HTTP_HEADERS,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=60
+            ),
+            http2=importlib.util.find_spec('h2') is not None,
+            follow_redirects=True
+        )
+    return http_client
 
+async def fetch(url, method='GET', timeout=None):
+    """Запрос через общий клиент, не больше HTTP_MAX_CONNECTIONS_PER_HOST соединений на хост"""
+    host = urlsplit(url).hostname
+    semaphore = host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = host_semaphores[host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+
+    async with semaphore:
+        return await get_http_client().request(
+            method, url, timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+
+async def probe_source(url):
+    """HTTP-статус ответа на HEAD: проверка доступности сайта без загрузки страницы"""
+    response = await fetch(url, method='HEAD', timeout=HEALTH_CHECK_TIMEOUT)
+    return response.status_code
+
+# Доступность всех сайтов, с которых берем гороскопы: проверка раз в HEALTH_CHECK_INTERVAL секунд
+# в фоне, /debug показывает последние результаты
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '300'))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', '5'))
+health_monitor = HealthMonitor(
+    [url for info in ZODIAC_SIGNS.values() for url in info['sources']] + ([IGNIO_FEED_URL] if IGNIO_BULK else []),
+    probe_source,
+    timeout=HEALTH_CHECK_TIMEOUT
+)
+
+async def close_http_client(application):
+    """Закрываем пул соединений при остановке бота"""
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+# Клавиатуры неизменяемы (объекты PTB заморожены), поэтому собираем каждую один раз
+@functools.lru_cache(maxsize=None)
 def get_main_keyboard():
     keyboard = [
         [KeyboardButton("🔮 Погадать")],
@@ -192,124 +441,197 @@ def get_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+@functools.lru_cache(maxsize=None)
 def get_tarot_keyboard():
     keyboard = [
         [KeyboardButton("1️⃣ Одна карта"), KeyboardButton("3️⃣ Три карты")],
+        [KeyboardButton("✝️ Кельтский крест")],
         [KeyboardButton("↩️ Назад")]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-def parse_horo_mail(url):
+@functools.lru_cache(maxsize=None)
+def compile_selectors(selectors):
+    """CSS-селекторы вида .class, [attr="v"] и [attr*="v"] один раз компилируем в XPath"""
+    compiled = []
+    for selector in selectors:
+        if selector.startswith('.'):
+            xpath = f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {selector[1:]} ')]"
+        else:
+            match = re.fullmatch(r'\[([\w-]+)(\*?)="([^"\']*)"\]', selector)
+            if not match:
+                raise ValueError(f"Неподдерживаемый селектор: {selector}")
+            attr, contains, value = match.groups()
+            xpath = f"//*[contains(@{attr}, '{value}')]" if contains else f"//*[@{attr}='{value}']"
+        compiled.append(etree.XPath(xpath))
+    return compiled
+
+# Как get_text(strip=True) в BeautifulSoup: без скриптов, стилей и комментариев
+TEXT_NODES = etree.XPath('.//text()[not(ancestor::script or ancestor::style)]', smart_strings=False)
+FALLBACK_CONTAINERS = etree.XPath('//div[@class] | //section[@class] | //article[@class]')
+
+HORO_MAIL_SELECTORS = compile_selectors((
+    '.article__text',
+    '.p-prediction__text',
+    '.article__item__text',
+    '.prediction__text',
+    '[class*="article"]',
+    '[class*="prediction"]'
+))
+
+RAMBLER_SELECTORS = compile_selectors((
+    '.mvh__description',
+    '[data-cy="horoscope-description"]',
+    '.xN_sL',
+    '.h7qoQ',
+    '[class*="description"]',
+    '[class*="text"]'
+))
+
+def parse_html(content):
+    return lxml.html.document_fromstring(content)
+
+def element_text(element):
+    return ''.join(text.strip() for text in TEXT_NODES(element))
+
+def extract_horo_mail(content):
+    """Извлечение текста гороскопа из страницы horo.mail.ru"""
+    document = parse_html(content)
+    
+    for selector in HORO_MAIL_SELECTORS:
+        for element in selector(document):
+            text = element_text(element)
+            if len(text) > 100 and any(word in text.lower() for word in ['сегодня', 'гороскоп', 'день', 'неделя']):
+                return re.sub(r'\s+', ' ', text)
+    
+    return None
+
+async def parse_horo_mail(url):
     """Парсинг horo.mail.ru"""
     try:
-        session = get_session()
-        response = session.get(url, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        selectors = [
-            '.article__text',
-            '.p-prediction__text', 
-            '.article__item__text',
-            '.prediction__text',
-            '[class*="article"]',
-            '[class*="prediction"]'
-        ]
-        
-        for selector in selectors:
-            elements = soup.select(selector)
-            for element in elements:
-                text = element.get_text(strip=True)
-                if len(text) > 100 and any(word in text.lower() for word in ['сегодня', 'гороскоп', 'день', 'неделя']):
-                    return re.sub(r'\s+', ' ', text)
-        
-        return None
+        response = await fetch(url)
+        # Разбор HTML выносим из event loop, чтобы не блокировать остальных пользователей
+        return await asyncio.to_thread(runtime_profiler.threaded(extract_horo_mail), response.content)
     except Exception as e:
         logger.error(f"Ошибка парсинга horo.mail.ru: {e}")
         return None
 
-def parse_rambler(url):
+def extract_rambler(content):
+    """Извлечение текста гороскопа из страницы rambler.ru"""
+    document = parse_html(content)
+    
+    for selector in RAMBLER_SELECTORS:
+        for element in selector(document):
+            text = element_text(element)
+            if len(text) > 100:
+                return re.sub(r'\s+', ' ', text)
+    
+    return None
+
+async def parse_rambler(url):
     try:
-        session = get_session()
-        response = session.get(url, timeout=10)
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        selectors = [
-            '.mvh__description',
-            '[data-cy="horoscope-description"]',
-            '.xN_sL',
-            '.h7qoQ',
-            '[class*="description"]',
-            '[class*="text"]'
-        ]
-        
-        for selector in selectors:
-            elements = soup.select(selector)
-            for element in elements:
-                text = element.get_text(strip=True)
-                if len(text) > 100:
-                    return re.sub(r'\s+', ' ', text)
-        
-        return None
+        response = await fetch(url)
+        return await asyncio.to_thread(runtime_profiler.threaded(extract_rambler), response.content)
     except Exception as e:
         logger.error(f"Ошибка парсинга rambler.ru: {e}")
         return None
 
-def parse_ignio(url):
+def extract_ignio(xml_text):
+    """Извлечение текста гороскопа из XML ignio.com"""
+    today_match = re.search(r'<today>(.*?)</today>', xml_text, re.DOTALL)
+    prediction_match = re.search(r'<prediction>(.*?)</prediction>', xml_text, re.DOTALL)
+    
+    text = ""
+    if today_match:
+        text = today_match.group(1)
+    elif prediction_match:
+        text = prediction_match.group(1)
+    
+    if text:
+        # Очищаем от XML тегов
+        text = re.sub(r'<.*?>', '', text)
+        text = re.sub(r'\s+', ' ', text).strip()
+        if len(text) > 50:
+            return text
+    
+    return None
+
+async def parse_ignio(url):
     """Парсинг ignio.com (XML)"""
     try:
-        session = get_session()
-        response = session.get(url, timeout=10)
+        response = await fetch(url)
         
         if response.status_code == 200:
-            today_match = re.search(r'<today>(.*?)</today>', response.text, re.DOTALL)
-            prediction_match = re.search(r'<prediction>(.*?)</prediction>', response.text, re.DOTALL)
-            
-            text = ""
-            if today_match:
-                text = today_match.group(1)
-            elif prediction_match:
-                text = prediction_match.group(1)
-            
-            if text:
-                # Очищаем от XML тегов
-                text = re.sub(r'<.*?>', '', text)
-                text = re.sub(r'\s+', ' ', text).strip()
-                if len(text) > 50:
-                    return text
+            return await asyncio.to_thread(runtime_profiler.threaded(extract_ignio), response.text)
         
         return None
     except Exception as e:
         logger.error(f"Ошибка парсинга ignio.com: {e}")
         return None
 
-def parse_with_fallback(session, url, selectors, zodiac_sign):
-    """Парсинг с несколькими попытками и разными методами"""
+def extract_ignio_feed(content):
+    """Потоковый разбор общей ленты ignio: {английское название знака: текст на сегодня}"""
+    texts = {}
+    path = []
+    for event, element in ET.iterparse(io.BytesIO(content), events=('start', 'end')):
+        if event == 'start':
+            path.append(element.tag)
+            continue
+        
+        path.pop()
+        if element.tag == 'today' and path:
+            text = re.sub(r'\s+', ' ', element.text or '').strip()
+            if len(text) > 50:
+                texts[path[-1]] = text
+        elif len(path) == 1:
+            # Знак разобран — освобождаем память
+            element.clear()
+    return texts
+
+async def parse_ignio_feed(url):
+    """Гороскопы всех знаков из общей ленты ignio: {знак: текст}"""
     try:
-        response = session.get(url, timeout=15)
+        response = await fetch(url)
         response.raise_for_status()
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Пробуем разные селекторы
-        for selector in selectors:
-            element = soup.select_one(selector)
-            if element and element.get_text(strip=True):
-                text = element.get_text(strip=True)
-                if len(text) > 100:  # Проверяем, что текст достаточно длинный
-                    return re.sub(r'\s+', ' ', text)
-        
-        # Если селекторы не сработали
-        possible_containers = soup.find_all(['div', 'section', 'article'], class_=True)
-        for container in possible_containers:
-            text = container.get_text(strip=True)
-            if len(text) > 200 and any(word in text.lower() for word in ['гороскоп', 'прогноз', 'сегодня']):
-                return re.sub(r'\s+', ' ', text)[:1000]  # Ограничиваем длину
+        texts = await asyncio.to_thread(runtime_profiler.threaded(extract_ignio_feed), response.content)
+        return {IGNIO_SIGNS[name]: text for name, text in texts.items() if name in IGNIO_SIGNS}
+    except Exception as e:
+        logger.error(f"Ошибка разбора общей ленты ignio.com: {e}")
+        return {}
+
+def extract_with_fallback(content, selectors):
+    """Извлечение текста по списку селекторов с запасным поиском по контейнерам"""
+    document = parse_html(content)
+    
+    # Пробуем разные селекторы, по первому совпадению каждого
+    for selector in compile_selectors(tuple(selectors)):
+        elements = selector(document)
+        if elements:
+            text = element_text(elements[0])
+            if len(text) > 100:  # Проверяем, что текст достаточно длинный
+                return re.sub(r'\s+', ' ', text)
+    
+    # Если селекторы не сработали
+    for container in FALLBACK_CONTAINERS(document):
+        text = element_text(container)
+        if len(text) > 200 and any(word in text.lower() for word in ['гороскоп', 'прогноз', 'сегодня']):
+            return re.sub(r'\s+', ' ', text)[:1000]  # Ограничиваем длину
+    
+    return None
+
+async def parse_with_fallback(url, selectors, zodiac_sign):
+    """Парсинг с несколькими попытками и разными методами"""
+    try:
+        response = await fetch(url, timeout=15)
+        response.raise_for_status()
         
-        return None
+        return await asyncio.to_thread(runtime_profiler.threaded(extract_with_fallback), response.content, selectors)
     except Exception as e:
         logger.error(f"Ошибка при парсинге {url}: {e}")
         return None
 
+@functools.lru_cache(maxsize=None)
 def get_zodiac_keyboard():
     keyboard = []
     signs_list = list(ZODIAC_SIGNS.items())
@@ -327,7 +649,173 @@ def get_zodiac_keyboard():
     keyboard.append([KeyboardButton("↩️ Назад в меню")])
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
-def get_daily_horoscope(zodiac_sign):
+def horoscope_today():
+    """Текущая дата в часовом поясе сайтов гороскопов"""
+    return datetime.datetime.now(HOROSCOPE_TIMEZONE).date()
+
+def is_horoscope_cached(zodiac_sign):
+    return horoscope_cache['date'] == horoscope_today() and zodiac_sign in horoscope_cache['horoscopes']
+
+def store_horoscopes(day, horoscopes):
+    """Сохраняем гороскопы за день, подменяя весь словарь кэша за одну операцию"""
+    global horoscope_cache
+    if horoscope_cache['date'] == day:
+        horoscopes = {**horoscope_cache['horoscopes'], **horoscopes}
+    elif horoscope_cache['date'] is not None and horoscope_cache['date'] > day:
+        return
+    else:
+        # Наступил новый день: вчерашние тексты остаются запасными
+        for sign, text in horoscope_cache['horoscopes'].items():
+            horoscope_stale[sign] = (horoscope_cache['date'], text)
+    horoscope_cache = {'date': day, 'horoscopes': horoscopes}
+
+def stale_horoscope(cache, zodiac_sign, today):
+    """(дата, текст) последнего известного гороскопа до сегодняшнего дня или None.
+    До первой записи за новый день вчерашние тексты еще лежат в самом кэше"""
+    if cache['date'] is not None and cache['date'] < today and zodiac_sign in cache['horoscopes']:
+        stale = cache['date'], cache['horoscopes'][zodiac_sign]
+    else:
+        stale = horoscope_stale.get(zodiac_sign)
+    if stale is None or (today - stale[0]).days > HOROSCOPE_STALE_DAYS:
+        return None
+    return stale
+
+async def save_horoscopes(day, entries):
+    """Записываем гороскопы на диск, entries — список (знак, источник, текст)"""
+    if horoscope_store is None:
+        return
+    try:
+        await asyncio.to_thread(horoscope_store.save, day, entries)
+    except Exception as e:
+        logger.error(f"Ошибка записи гороскопов на диск: {e}")
+
+def open_horoscope_store():
+    """Открываем хранилище и загружаем в память сегодняшние и последние прошлые гороскопы"""
+    global horoscope_store
+    try:
+        horoscope_store = HoroscopeStore(HOROSCOPE_DB_PATH)
+        today = horoscope_today()
+        horoscope_store.prune(today - datetime.timedelta(days=HOROSCOPE_KEEP_DAYS))
+        horoscope_stale.update(horoscope_store.load_latest_before(today))
+        loaded = horoscope_store.load_day(today)
+        store_horoscopes(today, loaded)
+        logger.info(f"Загружено с диска гороскопов: {len(loaded)} за сегодня, {len(horoscope_stale)} прошлых")
+    except Exception as e:
+        logger.error(f"Не удалось открыть хранилище гороскопов {HOROSCOPE_DB_PATH}: {e}")
+        horoscope_store = None
+
+def close_horoscope_store():
+    global horoscope_store
+    if horoscope_store is not None:
+        horoscope_store.close()
+        horoscope_store = None
+
+async def parse_source(url):
+    """Гороскоп с одного источника или None, если текст не подходит"""
+    horoscope_text = None
+    parser = None
+    if 'horo.mail.ru' in url:
+        parser = parse_horo_mail
+    elif 'rambler.ru' in url:
+        parser = parse_rambler
+    elif 'ignio.com' in url:
+        parser = parse_ignio
+    if parser is None:
+        return None
+    
+    with source_seconds.time(parser=parser.__name__) as labels:
+        try:
+            horoscope_text = await parser(url)
+        except Exception:
+            source_failures.inc(parser=parser.__name__)
+            raise
+        if not horoscope_text or len(horoscope_text) <= 50:
+            labels['outcome'] = 'empty'
+            source_failures.inc(parser=parser.__name__)
+            return None
+    return horoscope_text
+
+async def fetch_horoscope(zodiac_sign):
+    """Получаем гороскоп с сайтов: сначала с самого быстрого здорового источника,
+    при задержке параллельно спрашиваем следующий, побеждает первый ответ"""
+    sources = ZODIAC_SIGNS[zodiac_sign]['sources']
+    
+    logger.info(f"Пытаемся получить гороскоп для {zodiac_sign} из {len(sources)} источников")
+    
+    source, horoscope_text = await source_pool.first(sources, parse_source)
+    if horoscope_text:
+        logger.info(f"Успешно получили гороскоп для {zodiac_sign} с {source}")
+    return source, horoscope_text
+
+def horoscope_key(day, zodiac_sign):
+    return f"horoscope:{day.isoformat()}:{zodiac_sign}"
+
+async def share_horoscopes(day, horoscopes):
+    """Кладем гороскопы в общее хранилище, чтобы другие процессы не скачивали их заново"""
+    try:
+        await state.set_many(
+            {horoscope_key(day, sign): text for sign, text in horoscopes.items()},
+            ttl=HOROSCOPE_STATE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить гороскопы в общее хранилище: {e}")
+
+async def load_horoscope(zodiac_sign, day):
+    """Берем гороскоп из общего хранилища, а если его там нет —
+    скачиваем и сохраняем в память, на диск и в общее хранилище"""
+    try:
+        horoscope_text = await state.get(horoscope_key(day, zodiac_sign), cached=True)
+    except Exception as e:
+        logger.warning(f"Общее хранилище недоступно: {e}")
+        horoscope_text = None
+    if horoscope_text:
+        store_horoscopes(day, {zodiac_sign: horoscope_text})
+        return horoscope_text
+
+    source, horoscope_text = await fetch_horoscope(zodiac_sign)
+    if horoscope_text:
+        store_horoscopes(day, {zodiac_sign: horoscope_text})
+        await save_horoscopes(day, [(zodiac_sign, urlsplit(source).hostname, horoscope_text)])
+        await share_horoscopes(day, {zodiac_sign: horoscope_text})
+    return horoscope_text
+
+def finish_horoscope_fetch(key, task):
+    horoscope_inflight.pop(key, None)
+    _, zodiac_sign = key
+    if not task.cancelled() and task.exception() is None and task.result():
+        horoscope_backoff.pop(zodiac_sign, None)
+        return
+    failures = horoscope_backoff.get(zodiac_sign, (0, 0))[0] + 1
+    delay = min(HOROSCOPE_RETRY_DELAY * 2 ** (failures - 1), HOROSCOPE_RETRY_MAX_DELAY)
+    horoscope_backoff[zodiac_sign] = (failures, time.monotonic() + delay)
+
+def start_horoscope_fetch(zodiac_sign, day, force=False):
+    """Single-flight: на каждый (день, знак) выполняется не больше одной загрузки.
+    None — знак недавно не загрузился и срок повтора не наступил (force — не ждать его)"""
+    key = (day, zodiac_sign)
+    task = horoscope_inflight.get(key)
+    if task is None:
+        backoff = horoscope_backoff.get(zodiac_sign)
+        if not force and backoff is not None and time.monotonic() < backoff[1]:
+            horoscope_stats['backoff'] += 1
+            return None
+        horoscope_stats['fetches'] += 1
+        task = asyncio.ensure_future(load_horoscope(zodiac_sign, day))
+        horoscope_inflight[key] = task
+        task.add_done_callback(functools.partial(finish_horoscope_fetch, key))
+    else:
+        horoscope_stats['coalesced'] += 1
+    return task
+
+async def fetch_horoscope_once(zodiac_sign, day, force=False):
+    """Одновременные промахи по одному знаку ждут один и тот же запрос к сайтам"""
+    task = start_horoscope_fetch(zodiac_sign, day, force)
+    if task is None:
+        return None
+    # shield: отмена одного ожидающего не должна отменять запрос для остальных
+    return await asyncio.shield(task)
+
+async def get_daily_horoscope(zodiac_sign):
     """Основная функция получения гороскопа"""
     try:
         # Проверяем валидность знака
@@ -342,269 +830,674 @@ def get_daily_horoscope(zodiac_sign):
             return "Ошибка конфигурации"
         
         # Проверяем кэш
-        today = datetime.date.today()
-        if horoscope_cache['date'] != today:
-            horoscope_cache['date'] = today
-            horoscope_cache['horoscopes'] = {}
-        
-        if zodiac_sign in horoscope_cache['horoscopes']:
-            return horoscope_cache['horoscopes'][zodiac_sign]
+        today = horoscope_today()
+        cache = horoscope_cache
+        if cache['date'] == today and zodiac_sign in cache['horoscopes']:
+            horoscope_stats['hits'] += 1
+            return cache['horoscopes'][zodiac_sign]
         
-        sources = sign_info['sources']
-        horoscope_text = None
+        horoscope_stats['misses'] += 1
         
-        logger.info(f"Пытаемся получить гороскоп для {zodiac_sign} из {len(sources)} источников")
+        # stale-while-revalidate: отдаем прошлый гороскоп, свежий загружаем в фоне
+        stale = stale_horoscope(cache, zodiac_sign, today)
+        if stale is not None:
+            horoscope_stats['stale'] += 1
+            loading = start_horoscope_fetch(zodiac_sign, today) is not None
+            stale_date, stale_text = stale
+            status = "свежий уже загружается" if loading else "сайты с гороскопами сейчас недоступны"
+            return f"{stale_text}\n\n⏳ Это гороскоп за {stale_date:%d.%m}, {status}."
         
-        # Пробуем все источники по порядку
-        for i, url in enumerate(sources):
-            try:
-                logger.info(f"Источник {i+1}: {url}")
-                
-                if 'horo.mail.ru' in url:
-                    horoscope_text = parse_horo_mail(url)
-                elif 'rambler.ru' in url:
-                    horoscope_text = parse_rambler(url)
-                elif 'ignio.com' in url:
-                    horoscope_text = parse_ignio(url)
-                
-                if horoscope_text and len(horoscope_text) > 50:
-                    logger.info(f"Успешно получили гороскоп с источника {i+1}")
-                    # Сохраняем в кэш
-                    horoscope_cache['horoscopes'][zodiac_sign] = horoscope_text
-                    return horoscope_text
-                    
-            except Exception as e:
-                logger.warning(f"Ошибка с источником {i+1}: {e}")
-                continue
+        horoscope_text = await fetch_horoscope_once(zodiac_sign, today)
+        if horoscope_text:
+            return horoscope_text
         
         # Если все источники не сработали
-        logger.error("Все источники недоступны, возвращаем заглушку")
-        return "К сожалению, не удалось получить актуальный гороскоп. Сайты могут быть временно недоступны. Попробуйте позже."
+        logger.error("Все источники недоступны, возвращаем запасной гороскоп")
+        return BACKUP_HOROSCOPES[zodiac_sign]
         
     except Exception as e:
         logger.error(f"Критическая ошибка в get_daily_horoscope: {e}")
         return "Произошла ошибка при получении гороскопа."
 
-def check_site_availability():
-    """Проверяем доступность сайтов перед парсингом"""
-    session = get_session()
-    test_urls = [
-        'https://horo.mail.ru',
-        'https://horoscopes.rambler.ru',
-        'https://www.goroskop.ru'
+async def prefetch_horoscopes(context: ContextTypes.DEFAULT_TYPE):
+    """Прогрев кэша: параллельно скачиваем гороскопы для всех знаков"""
+    job_data = context.job.data or {}
+    today = horoscope_today()
+    signs = job_data.get('signs') or list(ZODIAC_SIGNS)
+    attempt = job_data.get('attempt', 0)
+    
+    # Повтор, запланированный вчера, сегодня уже не нужен
+    if job_data.get('date', today) != today:
+        return
+    
+    if horoscope_cache['date'] == today:
+        signs = [sign for sign in signs if sign not in horoscope_cache['horoscopes']]
+    if not signs:
+        return
+    
+    # Сначала одна общая лента ignio на все знаки, остальное — по одному знаку
+    if IGNIO_BULK:
+        with source_seconds.time(parser='parse_ignio_feed'):
+            fetched = await parse_ignio_feed(IGNIO_FEED_URL)
+        fetched = {sign: text for sign, text in fetched.items() if sign in signs}
+        if fetched:
+            store_horoscopes(today, fetched)
+            await save_horoscopes(today, [(sign, 'ignio.com', text) for sign, text in fetched.items()])
+            await share_horoscopes(today, fetched)
+            logger.info(f"Из общей ленты ignio получено гороскопов: {len(fetched)}")
+            signs = [sign for sign in signs if sign not in fetched]
+        if not signs:
+            logger.info(f"Кэш гороскопов на {today} прогрет")
+            return
+    
+    logger.info(f"Прогрев кэша гороскопов: {len(signs)} знаков, попытка {attempt + 1}")
+    results = await asyncio.gather(
+        # У прогрева свой график повторов, поэтому срок повтора после неудачи он не ждет
+        *(fetch_horoscope_once(sign, today, force=True) for sign in signs), return_exceptions=True
+    )
+    # Успешные результаты уже сохранены в load_horoscope
+    failed = [
+        sign for sign, text in zip(signs, results)
+        if not text or isinstance(text, BaseException)
     ]
+    if failed:
+        delay = min(PREFETCH_RETRY_DELAY * 2 ** attempt, PREFETCH_RETRY_MAX_DELAY)
+        logger.warning(f"Не удалось получить гороскопы для {', '.join(failed)}, повтор через {delay} с")
+        context.job_queue.run_once(
+            prefetch_horoscopes,
+            when=delay,
+            data={'signs': failed, 'attempt': attempt + 1, 'date': today},
+            name='horoscope_prefetch_retry'
+        )
+    else:
+        logger.info(f"Кэш гороскопов на {today} прогрет")
+
+def schedule_horoscope_prefetch(app):
+    """Прогрев кэша при запуске и ежедневно вскоре после полуночи"""
+    if app.job_queue is None:
+        logger.warning("JobQueue недоступна (нужен python-telegram-bot[job-queue]), прогрев кэша отключен")
+        return
     
-    available_sites = []
-    for url in test_urls:
-        try:
-            response = session.head(url, timeout=10)
-            if response.status_code == 200:
-                available_sites.append(url)
-        except:
+    hour, minute = map(int, HOROSCOPE_PREFETCH_TIME.split(':'))
+    app.job_queue.run_once(prefetch_horoscopes, when=0, name='horoscope_prefetch')
+    app.job_queue.run_daily(
+        prefetch_horoscopes,
+        time=datetime.time(hour, minute, tzinfo=HOROSCOPE_TIMEZONE),
+        name='horoscope_prefetch'
+    )
+
+async def check_source_health(context: ContextTypes.DEFAULT_TYPE):
+    await health_monitor.check()
+    down = [host for host, health in health_monitor.snapshot().items() if health and not health['ok']]
+    if down:
+        logger.warning(f"Недоступны сайты гороскопов: {', '.join(down)}")
+
+def schedule_source_health(app):
+    if app.job_queue is None:
+        return
+    app.job_queue.run_repeating(check_source_health, interval=HEALTH_CHECK_INTERVAL, first=10, name='source_health')
+
+def split_message(text, limit=MessageLimit.MAX_TEXT_LENGTH):
+    """Делим текст на сообщения не длиннее limit символов, по возможности — по границам строк"""
+    parts = []
+    current = ''
+    for line in text.split('\n'):
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
             continue
-    
-    return available_sites
+        if current:
+            parts.append(current)
+        while len(line) > limit:
+            parts.append(line[:limit])
+            line = line[limit:]
+        current = line
+    if current:
+        parts.append(current)
+    return parts
 
 async def debug_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Команда для диагностики парсинга"""
-    available_sites = check_site_availability()
-    message = f"Доступные сайты: {len(available_sites)} из 3\n"
-    message += "\n".join(available_sites) if available_sites else "Все сайты недоступны"
+    """Команда для диагностики: отвечает сразу, по уже собранной статистике"""
+    snapshot = health_monitor.snapshot()
+    available = sum(1 for health in snapshot.values() if health and health['ok'])
+    if health_monitor.checked_at is None:
+        message = f"Доступность сайтов еще не проверялась (проверка раз в {HEALTH_CHECK_INTERVAL:.0f} с)"
+    else:
+        ago = time.time() - health_monitor.checked_at
+        message = f"Доступные сайты: {available} из {len(snapshot)} (проверка {ago:.0f} с назад)"
+    for host, health in snapshot.items():
+        if health is None:
+            continue
+        status = f"доступен, {health['latency'] * 1000:.0f} мс" if health['ok'] else f"недоступен: {health['error']}"
+        message += f"\n{host}: {status}; доступен в {health['uptime']:.0%} из {health['checks']} проверок"
     
-    # Тестовый парсинг
-    test_horoscope = get_daily_horoscope('овен')
-    message += f"\n\nТестовый гороскоп: {len(test_horoscope)} символов"
+    cached = len(horoscope_cache['horoscopes']) if horoscope_cache['date'] == horoscope_today() else 0
+    message += f"\n\nГороскопов в кэше на сегодня: {cached} из {len(ZODIAC_SIGNS)}"
+    message += (
+        f"\nКэш гороскопов: попаданий {horoscope_stats['hits']}, промахов {horoscope_stats['misses']}, "
+        f"объединено {horoscope_stats['coalesced']}, устаревших {horoscope_stats['stale']}, "
+        f"запросов к сайтам {horoscope_stats['fetches']}, отложено после неудач {horoscope_stats['backoff']}"
+    )
+    message += (
+        f"\nGemini: выполняется {prediction_gate.active}, в очереди {prediction_gate.waiting()}, "
+        f"отказов {prediction_gate.rejected}"
+    )
+    send_stats = send_scheduler.counters
+    message += (
+        f"\nОтправка: отправлено {send_stats['sent']}, ждали бюджета {send_stats['throttled']}, "
+        f"429 от Telegram {send_stats['retry_after']}, ошибок {send_stats['failed']}"
+    )
+    router_stats = model_router.counters
+    message += (
+        f"\nМодели: запросов {router_stats['requests']}, хеджировано {router_stats['hedged']}, "
+        f"ответила запасная {router_stats['fallback_wins']}, не уложились в срок {router_stats['timeouts']}"
+    )
+    for name, health in model_router.snapshot().items():
+        p50 = f"{health['p50']:.1f} с" if health['p50'] is not None else "нет данных"
+        status = "деградировала" if health['degraded'] else "работает"
+        message += f"\n{name}: {status}, успешных {health['success_rate']:.0%}, p50 {p50}"
+    pool_stats = prediction_pool.stats
+    message += (
+        f"\nПул предсказаний: из пула {pool_stats['hits']} из {pool_stats['requests']} тем "
+        f"({prediction_pool.hit_rate():.0%}), пул был пуст {pool_stats['misses']} раз, в пуле {len(prediction_pool)}; "
+        f"пополнение: {pool_stats['generated']} предсказаний за {pool_stats['seconds']:.0f} с, "
+        f"токенов {pool_stats['tokens']}, ошибок {pool_stats['errors']}"
+    )
+    state_stats = state.stats()
+    message += (
+        f"\nСостояние ({state_stats['backend']}): чтений {state_stats['reads']}, записей {state_stats['writes']}, "
+        f"обращений к хранилищу {state_stats['batches']}, из кэша {state_stats['cache_hits']}"
+    )
+    if 'keys' in state_stats:
+        message += (
+            f", ключей {state_stats['keys']}, ~{state_stats['memory'] // 1024} КБ, "
+            f"вытеснено {state_stats['evicted']}"
+        )
+    for host, health in source_pool.snapshot().items():
+        p50 = f"{health['p50']:.2f} с" if health['p50'] is not None else "нет данных"
+        status = "отключен" if health['open'] else "работает"
+        message += f"\n{host}: {status}, успешных {health['success_rate']:.0%}, p50 {p50}"
+    message += f"\n\n{startup_profile.report()}"
+    message += "\n\nЗадержки (верхняя граница корзины):"
+    for histogram in (handler_seconds, gemini_seconds, source_seconds):
+        for labels, count, p50, p95 in histogram.summary():
+            name = ", ".join(str(value) for value in labels.values())
+            message += f"\n{name}: {count} раз, p50 ≤ {p50} с, p95 ≤ {p95} с"
     
-    await update.message.reply_text(message)
+    # Серий задержек со временем становится много: длиннее лимита Telegram ответ уходит частями
+    for part in split_message(message):
+        await update.message.reply_text(part)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     welcome_text = "Привет! Я бот-гадалка. 🔮\nВыбери, как хочешь погадать:"
     await update.message.reply_text(welcome_text, reply_markup=get_main_keyboard())
+    if 'первый /start' not in startup_profile.milestones:
+        startup_profile.mark('первый /start')
+        logger.info(startup_profile.report())
+
+PROFILE_USAGE = (
+    "/profile [N] [Ts] [sample] — профилирование следующих N апдейтов (по умолчанию 100) "
+    "или T секунд; sample — выборка стеков вместо cProfile. /profile stop — закончить раньше"
+)
+
+async def send_profile_report(session, message):
+    try:
+        text, filename, data = await session.done
+    except Exception as e:
+        logger.error(f"Не удалось собрать профиль: {e}")
+        await message.reply_text(f"Не удалось собрать профиль: {e}")
+        return
+    logger.info(f"Профиль готов: {filename}")
+    # Лимит сообщения Telegram — 4096 символов, полный профиль — в файле
+    await message.reply_text(text[:4000])
+    await message.reply_document(document=io.BytesIO(data), filename=filename)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Профилирование обработчиков по команде администратора"""
+    args = [arg.lower() for arg in context.args]
+    if args == ['stop']:
+        if runtime_profiler.session is None:
+            await update.message.reply_text("Профилирование не запущено")
+        else:
+            runtime_profiler.stop()
+        return
+    
+    updates, seconds, mode = None, None, 'cpu'
+    try:
+        for arg in args:
+            if arg == 'sample':
+                mode = 'sample'
+            elif arg.endswith('s'):
+                seconds = float(arg[:-1])
+            else:
+                updates = int(arg)
+    except ValueError:
+        await update.message.reply_text(PROFILE_USAGE)
+        return
+    if updates is None and seconds is None:
+        updates = 100
+    
+    try:
+        session = runtime_profiler.start(mode, updates=updates, seconds=seconds)
+    except (RuntimeError, ValueError) as e:
+        await update.message.reply_text(f"Не удалось включить профилирование: {e}")
+        return
+    logger.info(f"Профилирование включено: {session.describe()}")
+    await update.message.reply_text(f"Профилирование включено: {session.describe()}")
+    context.application.create_task(send_profile_report(session, update.message), update=update)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
         "Доступные виды гаданий:\n"
         "🔮 Погадать - гадание с AI на любую тему\n"
         "🎱 Гадание на шаре - простой ответ да/нет\n"
-        "🃏 Таро - гадание на картах Таро (1 или 3 карты)\n"
+        "🃏 Таро - гадание на картах Таро (1 карта, 3 карты или кельтский крест)\n"
         "♊ Гороскоп - ежедневный гороскоп по знаку зодиака\n\n"
         "Просто выбери нужный вариант на клавиатуре!"
     )
     await update.message.reply_text(help_text)
 
-def draw_tarot_cards(count=1):
-    cards = random.sample(list(TAROT_CARDS.items()), count)
-    return cards
-
-def get_single_card_interpretation(card):
-    name, info = card
-    interpretations = [
-        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nЭта карта указывает на важные энергии в твоей жизни сейчас. Прислушайся к интуиции!",
-        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nАркан приносит тебе послание свыше. Задумайся над его значением.",
-        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nКарта показывает ключевую тему твоего нынешнего пути.",
-        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nЭтот аркан раскрывает тайны твоей судьбы в данный момент.",
-        f"{info['image']} **{name}**\n\n{info['meaning']}\n\nМудрость карты поможет тебе найти верное направление."
-    ]
-    return random.choice(interpretations)
+def estimate_tokens(text):
+    """Грубая оценка, пока точное число токенов неизвестно"""
+    return len(text) // 3 + 1
+
+async def count_tokens(text):
+    """Токены реплики по счетчику модели; если он еще не загружен или не ответил — оценка"""
+    if token_counter is None:
+        return estimate_tokens(text)
+    try:
+        response = await asyncio.wait_for(token_counter.count_tokens_async(text), TOKEN_COUNT_TIMEOUT)
+        return response.total_tokens
+    except Exception as e:
+        logger.warning(f"Не удалось посчитать токены: {e}")
+        return estimate_tokens(text)
+
+def build_prediction_request(history):
+    """Запрос к модели из самых свежих реплик, которые укладываются в GEMINI_HISTORY_TOKENS.
+    Реплика истории — [роль, текст, токены]; возвращает (запрос, токены истории в запросе)"""
+    turns = []
+    tokens = 0
+    for turn in reversed(history):
+        role, text = turn[0], turn[1]
+        turn_tokens = turn[2] if len(turn) > 2 else estimate_tokens(text)
+        # Последняя реплика пользователя попадает в запрос всегда
+        if turns and tokens + turn_tokens > GEMINI_HISTORY_TOKENS:
+            break
+        turns.append(({"role": role, "parts": [text]}, turn_tokens))
+        tokens += turn_tokens
+    # Диалог в запросе должен начинаться с реплики пользователя
+    while len(turns) > 1 and turns[-1][0]["role"] != "user":
+        tokens -= turns.pop()[1]
+    return [content for content, _ in reversed(turns)], tokens
 
-def get_three_cards_interpretation(cards):
-    past, present, future = cards
-    return (f"📜 **Расклад на три карты**\n\n"
-            f"🕰 **Прошлое:** {past[1]['image']} {past[0]}\n{past[1]['meaning']}\n\n"
-            f"⚡ **Настоящее:** {present[1]['image']} {present[0]}\n{present[1]['meaning']}\n\n"
-            f"🔮 **Будущее:** {future[1]['image']} {future[0]}\n{future[1]['meaning']}")
+PREDICTION_FOOTER = "\n\nХочешь погадать еще?"
+
+def log_token_usage(model_name, request, history_tokens, usage):
+    """Токены запроса и ответа по данным самой модели"""
+    if usage is None:
+        return
+    logger.info(
+        f"Gemini {model_name}: запрос {usage.prompt_token_count} токенов, "
+        f"реплик {len(request)} (история ~{history_tokens} токенов), "
+        f"ответ {usage.candidates_token_count}, всего {usage.total_token_count}"
+    )
+
+async def stream_prediction(thinking_message, full_prompt):
+    """Потоковая генерация: по мере прихода текста редактируем сообщение «Думаю...».
+    Возвращает (модель, текст, usage_metadata из последнего фрагмента)"""
+    loop = asyncio.get_running_loop()
+    last_edit = loop.time()
+    with gemini_seconds.time(kind='stream', model='none') as labels:
+        model_name, chunks, text = await model_router.generate(full_prompt, stream=True)
+        labels['model'] = model_name
+    usage = None
+    
+    while True:
+        try:
+            # Зависший поток не держит пользователя дольше GEMINI_DEADLINE
+            chunk = await asyncio.wait_for(chunks.__anext__(), model_router.deadline)
+        except StopAsyncIteration:
+            break
+        except TimeoutError:
+            logger.warning(f"Поток {model_name} завис, отдаем то, что успели получить")
+            break
+        text += chunk.text
+        usage = getattr(chunk, 'usage_metadata', None) or usage
+        now = loop.time()
+        # Чаще редактировать нельзя: Telegram ограничивает частоту правок.
+        # Промежуточную правку пропускаем, если бюджет чата уже исчерпан — итог все равно придет
+        if (text.strip() and now - last_edit >= STREAM_EDIT_INTERVAL
+                and send_scheduler.has_budget(thinking_message.chat_id)):
+            last_edit = now
+            try:
+                await thinking_message.edit_text(text + " ▌")
+            except TelegramError as e:
+                logger.warning(f"Не удалось обновить сообщение с предсказанием: {e}")
+    
+    await thinking_message.edit_text(text + PREDICTION_FOOTER)
+    return model_name, text, usage
 
+async def generate_pooled_prediction(topic):
+    """Предсказание для пула: тема без истории диалога"""
+    async with prediction_gate.slot(background=True):
+        request, _ = build_prediction_request([("user", topic)])
+        with gemini_seconds.time(kind='pool', model='none') as labels:
+            labels['model'], response, text = await model_router.generate(request)
+    usage = getattr(response, 'usage_metadata', None)
+    return text, getattr(usage, 'total_token_count', 0)
+
+async def refill_prediction_pool(context: ContextTypes.DEFAULT_TYPE):
+    missing = prediction_pool.missing()
+    if not missing:
+        return
+    try:
+        generated = await prediction_pool.refill(generate_pooled_prediction)
+    except Exception as e:
+        logger.warning(f"Не удалось пополнить пул предсказаний: {e}")
+        return
+    logger.info(f"Пул предсказаний пополнен на {generated} из {missing}, в пуле {len(prediction_pool)}")
+
+async def warm_up_gemini(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await model_router.load()
+    except Exception as e:
+        # Следующий запрос к модели попробует загрузить клиент еще раз
+        logger.error(f"Не удалось загрузить клиент Gemini: {e}")
+
+def schedule_gemini_warmup(app):
+    if app.job_queue is None:
+        return
+    app.job_queue.run_once(warm_up_gemini, when=GEMINI_WARMUP_DELAY, name='gemini_warmup')
+
+def schedule_prediction_pool(app):
+    if not PREDICTION_POOL_SIZE or app.job_queue is None:
+        return
+    app.job_queue.run_repeating(
+        refill_prediction_pool, interval=PREDICTION_POOL_REFILL_INTERVAL, first=60, name='prediction_pool'
+    )
+
+async def send_tarot_reading(spread_key, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(tarot.read(spread_key), reply_markup=get_tarot_keyboard())
+
+async def send_horoscope(sign_name, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    sign_info = ZODIAC_SIGNS[sign_name]
+    # Гороскопа нет в кэше — пока он загружается, показываем «печатает...»
+    if not is_horoscope_cached(sign_name):
+        await update.message.chat.send_action(ChatAction.TYPING)
+    
+    horoscope = await get_daily_horoscope(sign_name)
+    message = (
+        f"{sign_info['emoji']} **Гороскоп для {sign_name.capitalize()} на сегодня**\n\n{horoscope}"
+        "\n\nХочешь узнать гороскоп для другого знака?"
+    )
+    # Гороскоп и клавиатура знаков — одним сообщением
+    await update.message.reply_text(message, reply_markup=get_zodiac_keyboard())
+
+async def save_history(user_id, history):
+    """Ответ пользователю уже отправлен: недоступное хранилище стоит только этой реплики в истории"""
+    try:
+        await user_sessions.save(user_id, history)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить историю диалога {user_id}: {e}")
+
+@counted(runtime_profiler)
+@timed(handler_seconds, handler='handle_message')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     user_text = update.message.text
     logger.info(f"Обработка сообщения: {user_text}")
 
-    if user_text in ["🔮 Погадать", "🎱 Гадание на шаре", "🃏 Таро", "♊ Гороскоп", "ℹ️ Помощь", "↩️ Назад"]:
-        await handle_button(update, context)
+    # Кнопки, знаки зодиака и карты Таро — один поиск в таблице маршрутов
+    route = MESSAGE_ROUTES.get(route_key(user_text))
+    if route is not None:
+        await route(update, context)
         return
-    
-    # ТАРО
-    if user_text in ["1️⃣ Одна карта", "3️⃣ Три карты"]:
-        if user_text == "1️⃣ Одна карта":
-            card = draw_tarot_cards(1)[0]
-            interpretation = get_single_card_interpretation(card)
-            await update.message.reply_text(interpretation, reply_markup=get_tarot_keyboard())
-        else:
-            cards = draw_tarot_cards(3)
-            interpretation = get_three_cards_interpretation(cards)
-            await update.message.reply_text(interpretation, reply_markup=get_tarot_keyboard())
-        return
-    
-    # Гороскоп
-    for sign_name, sign_info in ZODIAC_SIGNS.items():
-        if isinstance(sign_info, dict) and 'emoji' in sign_info:
-            if sign_info['emoji'] in user_text or sign_name in user_text.lower():
-                # Отправляем сообщение о загрузке и сохраняем его
-                loading_message = await update.message.reply_text(f"🔮 Получаю гороскоп для {sign_info['emoji']} {sign_name.capitalize()}...")
-                
-                # Получаем гороскоп
-                horoscope = get_daily_horoscope(sign_name)
-                message = f"{sign_info['emoji']} **Гороскоп для {sign_name.capitalize()} на сегодня**\n\n{horoscope}"
-                
-                # Редактируем сообщение о загрузке, заменяя его на гороскоп
-                await loading_message.edit_text(message)
-                
-                # Отправляем клавиатуру отдельным сообщением
-                await update.message.reply_text("Хочешь узнать гороскоп для другого знака?", reply_markup=get_zodiac_keyboard())
-                return
-
-
-    if not context.user_data.get('awaiting_topic'):
+
+    # Флаг ожидания темы и история читаются из общего хранилища одним запросом
+    topic_key, session_key = awaiting_topic_key(user_id), user_sessions.key(user_id)
+    values = await state.get_many([topic_key, session_key])
+    if not values[topic_key]:
         await update.message.reply_text(
             "Пожалуйста, выберите действие на клавиатуре 👇",
             reply_markup=get_main_keyboard()
         )
         return
 
-    # AI
-    context.user_data.pop('awaiting_topic', None)
-    
-    if user_id not in user_sessions:
-        user_sessions[user_id] = []
+    # Популярная тема — отвечаем готовым предсказанием из пула, без запроса к модели
+    pooled = prediction_pool.take(user_text)
+    if pooled:
+        history = values[session_key] or []
+        history += [["user", user_text, estimate_tokens(user_text)], ["model", pooled, estimate_tokens(pooled)]]
+        await asyncio.gather(
+            state.delete(topic_key),
+            update.message.reply_text(pooled + PREDICTION_FOOTER, reply_markup=get_main_keyboard()),
+            save_history(user_id, history)
+        )
+        return
 
-    history = user_sessions[user_id]
-    
-    prompt = f"Сгенерируй загадочное и немного шутливое предсказание на тему: Всегда выдавай один большой вариант ответа(старайся давать ответы до 1000 символов, но использовать их все). И избегай таких предложений 'вот держи' и ему подобных. Выдавай пользователю сразу предсказание  {user_text}"
-    
-    user_message_for_history = {"role": "user", "parts": [prompt, user_text]}
-    history.append(user_message_for_history)
+    # AI
+    if not prediction_gate.try_enter(user_id):
+        # Флаг не сбрасываем: следующее сообщение снова будет принято как тема
+        await update.message.reply_text(
+            "Мои кристаллы сейчас перегружены желающими узнать судьбу 🔮 Попробуй через минутку — просто напиши тему еще раз."
+        )
+        return
     
+    history = values[session_key] or []
+    history.append(["user", user_text])
 
-    full_prompt = history[-MAX_HISTORY:]
-
+    # Главная клавиатура уже на экране, поэтому ответ не требует отдельного сообщения с ней:
+    # с потоком — «Думаю...» и его правки, без потока — «печатает...» и одно сообщение
+    thinking_message = None
     try:
-        thinking_message = await update.message.reply_text("Думаю... 🔮")
-        
-        response = model.generate_content(full_prompt)
-        bot_reply = response.text
+        # Внутри try: если общее хранилище недоступно, место в очереди Gemini все равно освободится
+        await state.delete(topic_key)
+        # Токены новой реплики считаем, пока отправляется «Думаю...» или «печатает...»
+        if GEMINI_STREAM:
+            placeholder = update.message.reply_text("Думаю... 🔮")
+        else:
+            placeholder = update.message.chat.send_action(ChatAction.TYPING)
+        sent, user_tokens = await asyncio.gather(placeholder, count_tokens(user_text))
+        if GEMINI_STREAM:
+            thinking_message = sent
+        history[-1].append(user_tokens)
+        full_prompt, history_tokens = build_prediction_request(history)
         
-        history.append({"role": "model", "parts": [bot_reply]})
+        async with prediction_gate.slot():
+            if GEMINI_STREAM:
+                model_name, bot_reply, usage = await stream_prediction(thinking_message, full_prompt)
+            else:
+                with gemini_seconds.time(kind='plain', model='none') as labels:
+                    model_name, response, bot_reply = await model_router.generate(full_prompt)
+                    labels['model'] = model_name
+                usage = getattr(response, 'usage_metadata', None)
+                await update.message.reply_text(bot_reply + PREDICTION_FOOTER, reply_markup=get_main_keyboard())
         
-        await thinking_message.delete()
-        await update.message.reply_text(bot_reply)
+        log_token_usage(model_name, full_prompt, history_tokens, usage)
+        reply_tokens = usage.candidates_token_count if usage is not None else estimate_tokens(bot_reply)
+        history.append(["model", bot_reply, reply_tokens])
         
     except Exception as e:
         logger.error(f"Ошибка при работе с Gemini: {e}")
-        await update.message.reply_text('Упс! Мои магические кристаллы затуманились...')
+        error_text = 'Упс! Мои магические кристаллы затуманились...' + PREDICTION_FOOTER
+        if thinking_message is not None:
+            await thinking_message.edit_text(error_text)
+        else:
+            await update.message.reply_text(error_text, reply_markup=get_main_keyboard())
+    finally:
+        prediction_gate.leave(user_id)
+
+    await save_history(user_id, history)
+
+async def ask_topic(update: Update):
+    await update.message.reply_text(
+        "О чем ты хочешь погадать? Напиши мне свою тему, например: 'любовь', 'работа', 'деньги' ✨"
+    )
+
+async def shake_magic_ball(update: Update):
+    answer = random.choice(MAGIC_BALL_ANSWERS)
+    await update.message.reply_text(f"🎱 {answer}")
+
+async def show_tarot_menu(update: Update):
+    await update.message.reply_text(
+        "Выбери, сколько карт Таро хочешь вытянуть:",
+        reply_markup=get_tarot_keyboard()
+    )
 
-    if len(history) > MAX_HISTORY * 2:
-        user_sessions[user_id] = history[-(MAX_HISTORY * 2):]
+async def show_zodiac_menu(update: Update):
+    await update.message.reply_text(
+        "Выбери свой знак зодиака:",
+        reply_markup=get_zodiac_keyboard()
+    )
 
+async def show_main_menu(update: Update):
     await update.message.reply_text(
-        "Хочешь погадать еще?",
+        "Возвращаюсь в главное меню:",
         reply_markup=get_main_keyboard()
     )
 
-async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_text = update.message.text
+async def show_help(update: Update):
+    await update.message.reply_text(HELP_TEXT)
+
+@timed(handler_seconds, handler='handle_button')
+async def handle_button(action, update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    logger.info(f"Обработка кнопки: {user_text}")
+    logger.info(f"Обработка кнопки: {update.message.text}")
 
-    context.user_data.pop('awaiting_topic', None)
+    # Любая кнопка сбрасывает ожидание темы, а «Погадать» включает его
+    awaiting = action is ask_topic
+    await state.set(awaiting_topic_key(user_id), True if awaiting else None, ttl=SESSION_IDLE_TTL)
+    await action(update)
 
-    if user_text == "🔮 Погадать":
-        context.user_data['awaiting_topic'] = True
-        await update.message.reply_text(
-            "О чем ты хочешь погадать? Напиши мне свою тему, например: 'любовь', 'работа', 'деньги' ✨"
-        )
+def route_key(text):
+    """Ключ таблицы маршрутов: без регистра, пробелов по краям и вариантов начертания эмодзи"""
+    return text.strip().lower().replace('\ufe0f', '')
 
-    elif user_text == "🎱 Гадание на шаре":
-        answers = [
-            "Знаки говорят — да! ✅",
-            "Мои кристаллы показывают — нет ❌",
-            "Шансы невелики... но все возможно 🌙",
-            "Определенно да! 🌟",
-            "Лучше не стоит 🚫",
-            "Да, но будь осторожен ⚠️",
-            "Нет, и это к лучшему 💫"
-        ]
-        answer = random.choice(answers)
-        await update.message.reply_text(f"🎱 {answer}")
+def build_message_routes():
+    """Таблица «текст сообщения -> обработчик», собирается один раз при загрузке"""
+    buttons = {
+        "🔮 Погадать": ask_topic,
+        "🎱 Гадание на шаре": shake_magic_ball,
+        "🃏 Таро": show_tarot_menu,
+        "♊ Гороскоп": show_zodiac_menu,
+        "ℹ️ Помощь": show_help,
+        "↩️ Назад": show_main_menu,
+        "↩️ Назад в меню": show_main_menu,
+    }
+    routes = {}
+    # Знак можно выбрать кнопкой, названием или одним эмодзи
+    for sign_name, sign_info in ZODIAC_SIGNS.items():
+        handler = functools.partial(send_horoscope, sign_name)
+        for text in (f"{sign_info['emoji']} {sign_name}", sign_name, sign_info['emoji']):
+            routes[route_key(text)] = handler
+    for text, spread_key in TAROT_BUTTONS.items():
+        routes[route_key(text)] = functools.partial(send_tarot_reading, spread_key)
+    # Кнопки меню добавляются последними: «♊ Гороскоп» — кнопка, а не знак
+    for text, action in buttons.items():
+        routes[route_key(text)] = functools.partial(handle_button, action)
+    return routes
 
-    elif user_text == "🃏 Таро":
-        await update.message.reply_text(
-            "Выбери, сколько карт Таро хочешь вытянуть:",
-            reply_markup=get_tarot_keyboard()
-        )
+MESSAGE_ROUTES = build_message_routes()
 
-    elif user_text == "♊ Гороскоп":
-        await update.message.reply_text(
-            "Выбери свой знак зодиака:",
-            reply_markup=get_zodiac_keyboard()
-        )
+def register_metrics():
+    """Метрики, которые читаются из уже существующих счетчиков в момент выгрузки"""
+    metrics.counter_callback('bot_horoscope_cache_total', 'Обращения к кэшу гороскопов', lambda: horoscope_stats, 'result')
+    metrics.gauge_callback(
+        'bot_startup_seconds', 'Секунд от старта процесса до этапа запуска',
+        lambda: startup_profile.milestones, 'milestone'
+    )
+    metrics.gauge_callback('bot_sessions', 'Пользователи с историей диалога', lambda: state.count('session:'))
+    metrics.counter_callback(
+        'bot_state_operations_total', 'Операции с общим хранилищем состояния',
+        lambda: {key: value for key, value in state.stats().items() if key in state.counters}, 'operation'
+    )
+    metrics.gauge_callback(
+        'bot_gemini_queue', 'Запросы к Gemini: выполняются и ждут',
+        lambda: {'active': prediction_gate.active, 'waiting': prediction_gate.waiting()}, 'state'
+    )
+    metrics.counter_callback('bot_gemini_rejected_total', 'Отказы из-за переполненной очереди Gemini', lambda: prediction_gate.rejected)
+    metrics.counter_callback('bot_model_router_total', 'События выбора модели', lambda: model_router.counters, 'event')
+    metrics.counter_callback('bot_prediction_pool_total', 'Пул готовых предсказаний', lambda: prediction_pool.stats, 'field')
+    metrics.gauge_callback('bot_prediction_pool_size', 'Предсказаний в пуле', lambda: len(prediction_pool))
+    metrics.counter_callback('bot_telegram_requests_total', 'Запросы к Bot API', lambda: send_scheduler.counters, 'result')
+    metrics.gauge_callback(
+        'bot_source_up', 'Сайт ответил на последнюю фоновую проверку',
+        lambda: {host: health['ok'] for host, health in health_monitor.snapshot().items() if health}, 'host'
+    )
+    metrics.gauge_callback(
+        'bot_horoscope_source_success_ratio', 'Доля успешных загрузок с сайта (скользящее окно)',
+        lambda: {host: health['success_rate'] for host, health in source_pool.snapshot().items()}, 'host'
+    )
 
-    elif user_text == "↩️ Назад":
-        await update.message.reply_text(
-            "Возвращаюсь в главное меню:",
-            reply_markup=get_main_keyboard()
-        )
+register_metrics()
 
-    elif user_text == "ℹ️ Помощь":
-        help_text = (
-            "Я могу:\n"
-            "🔮 Погадать - гадание на любую тему\n"
-            "🎱 Гадание на шаре - простой ответ да/нет\n"
-            "🃏 Таро - гадание на картах Таро (1 или 3 карты)\n"
-            "♊ Гороскоп - ежедневный гороскоп по знаку зодиака\n\n"
-            "Просто выбери нужный вариант на клавиатуре!"
-        )
-        await update.message.reply_text(help_text)
+async def start_metrics_server():
+    global metrics_server
+    if not METRICS_PORT:
+        return
+    try:
+        metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT)
+        logger.info(f"Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        # Например, порт уже занят другим воркером вебхука
+        logger.warning(f"Не удалось открыть порт метрик {METRICS_PORT}: {e}")
 
-def main():
-    app = Application.builder().token(os.getenv('TELEGRAM_TOKEN')).build()
+async def stop_metrics_server():
+    global metrics_server
+    if metrics_server is not None:
+        metrics_server.close()
+        metrics_server = None
+
+async def post_init(application):
+    open_horoscope_store()
+    await start_metrics_server()
+    startup_profile.mark('бот запущен')
+    logger.info(startup_profile.report())
+
+async def post_shutdown(application):
+    await close_http_client(application)
+    close_horoscope_store()
+    await state.close()
+    await stop_metrics_server()
+
+def build_application(polling=True):
+    """Приложение со всеми обработчиками; polling=False — без Updater, апдейты приходят через вебхук"""
+    builder = (
+        Application.builder()
+        .token(os.getenv('TELEGRAM_TOKEN'))
+        .concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+        .rate_limiter(send_scheduler)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not polling:
+        builder = builder.updater(None)
+    app = builder.build()
+    
+    # Клавиатуры собираем заранее, а не на первом апдейте
+    for get_keyboard in (get_main_keyboard, get_tarot_keyboard, get_zodiac_keyboard):
+        get_keyboard()
     
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("debug", debug_command))
+    if ADMIN_IDS:
+        app.add_handler(CommandHandler("profile", profile_command, filters=filters.User(user_id=ADMIN_IDS)))
     
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    schedule_horoscope_prefetch(app)
+    schedule_prediction_pool(app)
+    schedule_gemini_warmup(app)
+    schedule_source_health(app)
+    startup_profile.mark('приложение собрано')
+    return app
+
+startup_profile.mark('модуль bot загружен')
+
+def main():
+    app = build_application()
     app.run_polling()
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+
+class HealthMonitor:
+    """Фоновая проверка доступности сайтов.
+
+    Каждый хост проверяется одним адресом (первым из списка для этого хоста),
+    все хосты — параллельно; по каждому хранится history последних проверок.
+    probe(url) — корутина, возвращающая HTTP-статус ответа."""
+
+    def __init__(self, urls, probe, timeout=5.0, history=48):
+        self.urls = {}
+        for url in urls:
+            self.urls.setdefault(urlsplit(url).hostname, url)
+        self.probe = probe
+        self.timeout = timeout
+        # Хост -> [(время проверки, доступен, задержка, ошибка)]
+        self.history = {host: deque(maxlen=history) for host in self.urls}
+        self.checked_at = None
+
+    async def check_host(self, host, url):
+        start = time.monotonic()
+        try:
+            status = await asyncio.wait_for(self.probe(url), self.timeout)
+            ok, error = status < 400, None if status < 400 else f"HTTP {status}"
+        except TimeoutError:
+            ok, error = False, f"нет ответа за {self.timeout:g} с"
+        except Exception as e:
+            ok, error = False, str(e) or type(e).__name__
+        self.history[host].append((time.time(), ok, time.monotonic() - start, error))
+
+    async def check(self):
+        await asyncio.gather(*(self.check_host(host, url) for host, url in self.urls.items()))
+        self.checked_at = time.time()
+
+    def snapshot(self):
+        """Последняя проверка и доступность за историю по каждому хосту; None — проверок еще не было"""
+        result = {}
+        for host, checks in self.history.items():
+            if not checks:
+                result[host] = None
+                continue
+            _, ok, latency, error = checks[-1]
+            latencies = sorted(check[2] for check in checks if check[1])
+            result[host] = {
+                'ok': ok,
+                'error': error,
+                'latency': latency,
+                'p50': latencies[len(latencies) // 2] if latencies else None,
+                'uptime': sum(check[1] for check in checks) / len(checks),
+                'checks': len(checks),
+            }
+        return result
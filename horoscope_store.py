@@ -0,0 +1,62 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+
+class HoroscopeStore:
+    """Гороскопы на диске (SQLite в режиме WAL), ключ — (дата, знак, источник)"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS horoscopes ('
+            ' day TEXT NOT NULL,'
+            ' sign TEXT NOT NULL,'
+            ' source TEXT NOT NULL,'
+            ' text TEXT NOT NULL,'
+            ' fetched_at REAL NOT NULL,'
+            ' PRIMARY KEY (day, sign, source))'
+        )
+        self.conn.commit()
+
+    def save(self, day, entries):
+        """entries — список (знак, источник, текст)"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO horoscopes (day, sign, source, text, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                [(day.isoformat(), sign, source, text, now) for sign, source, text in entries]
+            )
+            self.conn.commit()
+
+    def load_day(self, day):
+        """Гороскопы за день: для каждого знака самый свежий из источников"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT sign, text FROM horoscopes WHERE day = ? ORDER BY fetched_at',
+                (day.isoformat(),)
+            ).fetchall()
+        return {sign: text for sign, text in rows}
+
+    def load_latest_before(self, day):
+        """Последний сохраненный гороскоп каждого знака до указанного дня: {знак: (дата, текст)}"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT day, sign, text FROM horoscopes WHERE day < ? ORDER BY day, fetched_at',
+                (day.isoformat(),)
+            ).fetchall()
+        return {sign: (datetime.date.fromisoformat(row_day), text) for row_day, sign, text in rows}
+
+    def prune(self, before):
+        """Удаляем записи старше указанного дня"""
+        with self.lock:
+            self.conn.execute('DELETE FROM horoscopes WHERE day < ?', (before.isoformat(),))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
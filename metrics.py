@@ -0,0 +1,212 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Гистограммы и счетчики считаются в памяти процесса; значения, которые уже
+хранят другие объекты бота (кэш гороскопов, очередь Gemini и т.п.), читаются
+функциями в момент выгрузки. Выгрузка — GET /metrics на локальном порту.
+"""
+import asyncio
+import bisect
+import contextlib
+import functools
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин в секундах: от быстрых ответов из кэша до долгих генераций Gemini
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in self.values.items():
+            lines.append(f'{self.name}{format_labels(key)} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        # Ключ меток -> [счетчики корзин (последняя — +Inf), сумма, количество]
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Замер блока; метки можно дополнить внутри блока через возвращаемый словарь.
+        outcome — ok, timeout, cancelled или error, если его не задали явно"""
+        start = time.perf_counter()
+        try:
+            yield labels
+        except asyncio.CancelledError:
+            labels.setdefault('outcome', 'cancelled')
+            raise
+        except TimeoutError:
+            labels.setdefault('outcome', 'timeout')
+            raise
+        except Exception:
+            labels.setdefault('outcome', 'error')
+            raise
+        finally:
+            labels.setdefault('outcome', 'ok')
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, key, q):
+        """Оценка квантиля сверху: граница корзины, в которую он попал"""
+        counts, _, total = self.series[key]
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """[(метки, количество, p50, p95)] для /debug"""
+        return [
+            (dict(key), series[2], self.quantile(key, 0.5), self.quantile(key, 0.95))
+            for key, series in self.series.items()
+        ]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, (counts, total_sum, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(key, [("le", format_value(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(key, [("le", "+Inf")])} {total}')
+            lines.append(f'{self.name}_sum{format_labels(key)} {format_value(total_sum)}')
+            lines.append(f'{self.name}_count{format_labels(key)} {total}')
+        return lines
+
+
+class CallbackMetric:
+    """Метрика, значение которой читается функцией при выгрузке.
+    Функция возвращает число, None (нет данных) или {значение метки: число}"""
+
+    def __init__(self, name, help_text, kind, callback, label=None):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.callback = callback
+        self.label = label
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать метрику {self.name}: {e}")
+            return []
+        if value is None:
+            return []
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        if isinstance(value, dict):
+            for label_value, number in value.items():
+                if number is not None:
+                    lines.append(f'{self.name}{format_labels([(self.label, label_value)])} {format_value(number)}')
+        else:
+            lines.append(f'{self.name} {format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, name, help_text, callback, label=None):
+        self.metrics.append(CallbackMetric(name, help_text, 'gauge', callback, label))
+
+    def counter_callback(self, name, help_text, callback, label=None):
+        self.metrics.append(CallbackMetric(name, help_text, 'counter', callback, label))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    async def handle(self, reader, writer):
+        """Минимальный HTTP: GET /metrics — метрики, остальное — 404"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+def timed(histogram, **labels):
+    """Декоратор для корутин: время выполнения попадает в гистограмму"""
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+
+from source_pool import SourceHealth, hedged
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter:
+    """Выбор модели Gemini с ограничением времени ответа.
+
+    Запрос идет в основную модель; если она не ответила за hedge_delay или упала,
+    параллельно спрашиваем запасную (быструю) модель и берем первый ответ.
+    Весь запрос ограничен deadline секундами. Если основная модель деградировала
+    (медиана задержки выше degraded_latency или failure_threshold раз подряд
+    упала либо не уложилась в deadline),
+    запросы сразу идут в запасную, а основная раз в cooldown секунд получает пробный запрос.
+
+    Для потокового ответа задержка — время до первого фрагмента. Запрос, отмененный
+    потому, что другая модель ответила раньше, неудачей не считается.
+
+    models — {имя: модель} или функция, которая создаст такой словарь: тогда
+    модели создаются при первом запросе (или вызове load) в отдельном потоке."""
+
+    def __init__(self, models, primary, fallback=None, deadline=30.0, hedge_delay=10.0,
+                 min_hedge_delay=1.0, degraded_latency=20.0, failure_threshold=3, cooldown=300, window=50):
+        if callable(models):
+            self.loader, self.models = models, None
+        else:
+            self.loader, self.models = None, models
+        self.loading = None
+        self.primary = primary
+        self.fallback = fallback
+        self.deadline = deadline
+        self.hedge_delay_default = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.degraded_latency = degraded_latency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.health = {name: SourceHealth(window) for name in (primary, fallback) if name}
+        self.primary_tried_at = 0.0
+        self.counters = {'requests': 0, 'hedged': 0, 'fallback_wins': 0, 'timeouts': 0}
+
+    async def load(self):
+        """Модели создаются один раз; одновременные запросы ждут одну и ту же загрузку"""
+        if self.models is None:
+            if self.loading is None:
+                self.loading = asyncio.ensure_future(asyncio.to_thread(self.loader))
+            try:
+                # shield: отмена одного запроса не должна прерывать загрузку для остальных
+                self.models = await asyncio.shield(self.loading)
+            except Exception:
+                if self.loading.done():
+                    self.loading = None
+                raise
+        return self.models
+
+    def is_degraded(self, name, now):
+        health = self.health[name]
+        median = health.latency_percentile(0.5)
+        return health.is_open(now, self.cooldown) or (median is not None and median > self.degraded_latency)
+
+    def order(self):
+        """Модели в порядке обращения"""
+        if not self.fallback:
+            return [self.primary]
+        now = time.monotonic()
+        if self.is_degraded(self.primary, now) and now - self.primary_tried_at < self.cooldown:
+            return [self.fallback, self.primary]
+        return [self.primary, self.fallback]
+
+    def hedge_delay(self, name):
+        """Сколько ждать модель, прежде чем параллельно спросить следующую"""
+        return self.health[name].hedge_delay(0.9, self.hedge_delay_default, self.min_hedge_delay, self.deadline)
+
+    async def request(self, name, request, stream):
+        response = await self.models[name].generate_content_async(request, stream=stream)
+        if stream:
+            chunks = response.__aiter__()
+            return chunks, (await chunks.__anext__()).text
+        return response, response.text
+
+    async def call(self, name, request, stream, deadline):
+        """(ответ, текст): для потока ответ — итератор оставшихся фрагментов,
+        текст — первый фрагмент; без потока — весь текст. TimeoutError после deadline"""
+        if name == self.primary:
+            self.primary_tried_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self.request(name, request, stream), deadline - loop.time())
+        except TimeoutError:
+            logger.warning(f"Модель {name} не ответила за {self.deadline:.0f} с")
+            self.health[name].record(False, 0, time.monotonic(), self.failure_threshold)
+            raise
+        except asyncio.CancelledError:
+            # Ответ другой модели пришел раньше: это не ошибка этой модели
+            raise
+        except Exception as e:
+            logger.warning(f"Ошибка модели {name}: {e}")
+            self.health[name].record(False, 0, time.monotonic(), self.failure_threshold)
+            raise
+        now = time.monotonic()
+        self.health[name].record(True, now - start, now, self.failure_threshold)
+        return result
+
+    def hedge_started(self, name):
+        self.counters['hedged'] += 1
+
+    async def generate(self, request, stream=False):
+        """(имя модели, ответ, текст) от первой успевшей модели; TimeoutError после deadline"""
+        self.counters['requests'] += 1
+        # Загрузка моделей не входит ни в срок ответа, ни в задержку модели
+        await self.load()
+        # Срок общий: каждая модель сама прерывается по нему, и ее промах учитывается в ее статистике
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        try:
+            name, (response, text) = await hedged(
+                self.order(), lambda name: self.call(name, request, stream, deadline),
+                self.hedge_delay, self.hedge_started,
+            )
+        except Exception as e:
+            # hedged пробрасывает последнюю ошибку: если одна модель не уложилась в срок,
+            # а другая упала иначе, запрос все равно сорван сроком
+            if not isinstance(e, TimeoutError) and loop.time() < deadline:
+                raise
+            self.counters['timeouts'] += 1
+            raise TimeoutError(f"Модели не ответили за {self.deadline:.0f} с") from e
+        if name != self.primary:
+            self.counters['fallback_wins'] += 1
+        return name, response, text
+
+    def snapshot(self):
+        """Состояние моделей для диагностики"""
+        now = time.monotonic()
+        return {
+            name: {
+                'success_rate': health.success_rate(),
+                'p50': health.latency_percentile(0.5),
+                'p90': health.latency_percentile(0.9),
+                'degraded': self.is_degraded(name, now),
+            }
+            for name, health in self.health.items()
+        }
@@ -0,0 +1,44 @@
+import asyncio
+import contextlib
+
+
+class PredictionGate:
+    """Ограничение запросов к модели: не больше max_concurrency одновременно,
+    не больше max_queue в очереди и не больше одного запроса на пользователя"""
+
+    def __init__(self, max_concurrency, max_queue):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.users = set()
+        self.active = 0
+        # Из них фоновых (пополнение пула): у них нет пользователя в users
+        self.background = 0
+        self.rejected = 0
+
+    def try_enter(self, user_id):
+        """Занимаем место в очереди; False — очередь полна или у пользователя уже есть запрос"""
+        if user_id in self.users or len(self.users) >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            return False
+        self.users.add(user_id)
+        return True
+
+    def leave(self, user_id):
+        self.users.discard(user_id)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, background=False):
+        """Ждем свободного места и выполняем запрос; background — запрос без пользователя"""
+        async with self.semaphore:
+            self.active += 1
+            self.background += background
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self.background -= background
+
+    def waiting(self):
+        """Запросы пользователей, которые еще не получили место"""
+        return len(self.users) - (self.active - self.background)
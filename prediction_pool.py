@@ -0,0 +1,105 @@
+import re
+import time
+from collections import deque
+
+
+# Служебные слова, которые не меняют тему: «про любовь», «на работу», «о деньгах»
+STOP_WORDS = {'о', 'об', 'обо', 'про', 'на', 'в', 'во', 'для', 'и', 'моя', 'мой', 'мою', 'мои', 'моей', 'моих'}
+# Окончания от длинных к коротким; после отсечения должно остаться не меньше трех букв
+ENDINGS = (
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ой', 'ий', 'ый', 'ам', 'ям', 'ом', 'ем', 'ью', 'ье', 'ья', 'ие', 'ия',
+    'а', 'я', 'у', 'ю', 'ы', 'и', 'е', 'о', 'ь'
+)
+# Основы с беглой гласной, которые отсечением окончаний не сводятся к общей
+STEM_ALIASES = {'любв': 'любов', 'денег': 'деньг', 'денеж': 'деньг', 'семь': 'сем'}
+
+
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            word = word[:-len(ending)]
+            break
+    return STEM_ALIASES.get(word, word)
+
+
+def normalize_topic(text):
+    """Ключ темы: без регистра, знаков препинания, служебных слов и окончаний.
+    «Любовь!», «о любви» и «про любовь» дают один и тот же ключ"""
+    words = re.findall(r'\w+', text.lower().replace('ё', 'е'))
+    return ' '.join(stem(word) for word in words if word not in STOP_WORDS)
+
+
+class PredictionPool:
+    """Заранее сгенерированные предсказания для популярных тем.
+
+    На каждую тему держим до size предсказаний не старше max_age секунд;
+    каждое выдается один раз. Пополнение идет в фоне и только пока
+    is_idle() — модель не занята запросами пользователей."""
+
+    def __init__(self, topics, size, max_age, is_idle):
+        self.topics = {normalize_topic(topic): topic for topic in topics}
+        self.size = size
+        self.max_age = max_age
+        self.is_idle = is_idle
+        self.pools = {key: deque() for key in self.topics}
+        self.stats = {
+            'requests': 0, 'hits': 0, 'misses': 0,
+            'generated': 0, 'errors': 0, 'seconds': 0.0, 'tokens': 0
+        }
+
+    def drop_expired(self, pool):
+        deadline = time.time() - self.max_age
+        while pool and pool[0][0] < deadline:
+            pool.popleft()
+
+    def take(self, text):
+        """Готовое предсказание для темы или None — тогда нужна живая генерация"""
+        self.stats['requests'] += 1
+        pool = self.pools.get(normalize_topic(text))
+        if pool is None:
+            return None
+        self.drop_expired(pool)
+        if not pool:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return pool.popleft()[1]
+
+    def missing(self):
+        """Сколько предсказаний не хватает до полного пула"""
+        for pool in self.pools.values():
+            self.drop_expired(pool)
+        return sum(self.size - len(pool) for pool in self.pools.values())
+
+    async def refill(self, generate):
+        """Дополняем пулы через generate(тема) -> (текст, токены) по кругу, по одному предсказанию на тему за проход,
+        чтобы при нехватке времени все темы пополнились равномерно.
+        Возвращает число сгенерированных предсказаний"""
+        generated = 0
+        while self.missing():
+            for key, topic in self.topics.items():
+                pool = self.pools[key]
+                if len(pool) >= self.size:
+                    continue
+                if not self.is_idle():
+                    return generated
+                start = time.perf_counter()
+                try:
+                    text, tokens = await generate(topic)
+                except Exception:
+                    self.stats['errors'] += 1
+                    raise
+                finally:
+                    self.stats['seconds'] += time.perf_counter() - start
+                pool.append((time.time(), text))
+                self.stats['generated'] += 1
+                self.stats['tokens'] += tokens
+                generated += 1
+        return generated
+
+    def hit_rate(self):
+        return self.stats['hits'] / self.stats['requests'] if self.stats['requests'] else 0.0
+
+    def __len__(self):
+        return sum(len(pool) for pool in self.pools.values())
@@ -0,0 +1,288 @@
+"""Профилирование работающего бота по команде администратора.
+
+Пока профилирование выключено, обработчики платят только за проверку
+profiler.session is None. Включенное профилирование длится до заданного числа
+апдейтов или секунд и собирает:
+
+- cProfile (режим cpu) всего, что выполняется в потоке цикла событий, —
+  обработчики, вызовы Gemini — и функций, переданных в рабочие потоки через
+  profiler.threaded (разбор страниц), или выборку стеков всех потоков раз
+  в sample_interval секунд (режим sample, накладные расходы меньше);
+- задержку цикла событий: насколько позже срока просыпается asyncio.sleep,
+  то есть как долго цикл был занят синхронной работой.
+"""
+import asyncio
+import cProfile
+import functools
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+
+# Функции, время которых показываем отдельно от общего топа
+FOCUS_FUNCTIONS = (
+    'handle_message', 'handle_button', 'parse_horo_mail', 'parse_rambler', 'parse_ignio',
+    'parse_ignio_feed', 'extract_horo_mail', 'extract_rambler', 'extract_ignio',
+    'extract_with_fallback', 'extract_ignio_feed', 'stream_prediction', 'generate',
+)
+
+# Где простаивают потоки: (окончание пути модуля, функция)
+IDLE_FRAMES = (
+    ('concurrent/futures/thread.py', '_worker'),  # рабочий поток to_thread ждет задачу
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+)
+
+
+def is_idle(filename, name):
+    """Цикл событий ждет событий в select, рабочий поток — задачу: это простой, а не работа"""
+    if 'selectors' in filename and name in ('select', 'poll') or "of 'select." in name:
+        return True
+    filename = filename.replace('\\', '/')
+    return any(filename.endswith(path) and name == function for path, function in IDLE_FRAMES)
+
+
+def short_path(filename):
+    parts = filename.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
+
+
+class LoopLagMonitor:
+    """Задержка цикла событий: сон на interval секунд и замер опоздания"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        self.task.cancel()
+
+    def summary(self, seconds):
+        if not self.lags:
+            return "Задержка цикла событий: нет замеров"
+        ordered = sorted(self.lags)
+        blocked = sum(self.lags)
+        return (
+            f"Задержка цикла событий: p50 {ordered[len(ordered) // 2] * 1000:.1f} мс, "
+            f"p99 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000:.1f} мс, "
+            f"максимум {ordered[-1] * 1000:.1f} мс; занят синхронной работой ~{blocked:.2f} с "
+            f"из {seconds:.1f} с ({blocked / seconds:.0%})"
+        )
+
+
+class StackSampler:
+    """Выборка стеков всех потоков (кроме своего) из отдельного потока;
+    стек начинается с имени потока в квадратных скобках"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.thread.ident:
+                    continue
+                self.samples += 1
+                if is_idle(frame.f_code.co_filename, frame.f_code.co_name):
+                    self.idle += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(f"[{names.get(thread_id, thread_id)}]")
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def top(self, limit):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        busy = self.samples - self.idle
+        lines = [f"Выборок стеков потоков {self.samples}, из них в простое {self.idle}"]
+        lines.append("Больше всего собственного времени (доля выборок с работой):")
+        lines += [f"{count / busy:6.1%}  {frame}" for frame, count in own.most_common(limit)] if busy else []
+        focus = [
+            (frame, count) for frame, count in total.most_common()
+            if frame.split(' ', 1)[0] in FOCUS_FUNCTIONS
+        ]
+        if focus:
+            lines.append("Обработчики, парсеры и Gemini (включая вызванные функции):")
+            lines += [f"{count / busy:6.1%}  {frame}" for frame, count in focus]
+        return lines
+
+    def dump(self):
+        """Свернутые стеки (формат flamegraph.pl и speedscope)"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode()
+
+
+class ProfileSession:
+    def __init__(self, mode, updates, seconds, lag_interval, sample_interval):
+        self.mode = mode
+        self.max_updates = updates
+        self.max_seconds = seconds
+        self.updates = 0
+        self.started = time.monotonic()
+        self.elapsed = None
+        self.done = asyncio.get_running_loop().create_future()
+        self.lag = LoopLagMonitor(lag_interval)
+        self.profile = None
+        # Профили вызовов в рабочих потоках: cProfile видит только поток, в котором включен
+        self.thread_profiles = []
+        self.sampler = None
+        if mode == 'cpu':
+            self.profile = cProfile.Profile()
+        else:
+            self.sampler = StackSampler(sample_interval)
+        self.timer = None
+
+    def describe(self):
+        limit = f"{self.max_updates} апдейтов или {self.max_seconds:.0f} с" if self.max_updates else f"{self.max_seconds:.0f} с"
+        return f"{'cProfile' if self.mode == 'cpu' else 'выборка стеков'}, до {limit}"
+
+
+class RuntimeProfiler:
+    def __init__(self, max_seconds=300, lag_interval=0.01, sample_interval=0.005, top=15):
+        self.max_seconds = max_seconds
+        self.lag_interval = lag_interval
+        self.sample_interval = sample_interval
+        self.top = top
+        self.session = None
+
+    def start(self, mode='cpu', updates=None, seconds=None):
+        """Включаем профилирование; результат — session.done: (текст, имя файла, содержимое файла)"""
+        if self.session is not None:
+            raise RuntimeError("Профилирование уже идет")
+        seconds = min(seconds or self.max_seconds, self.max_seconds)
+        session = ProfileSession(mode, updates, seconds, self.lag_interval, self.sample_interval)
+        if session.profile is not None:
+            # ValueError, если в процессе уже работает другой профилировщик
+            session.profile.enable()
+        else:
+            session.sampler.start()
+        session.lag.start()
+        session.timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+        self.session = session
+        return session
+
+    def update_done(self):
+        session = self.session
+        session.updates += 1
+        if session.max_updates and session.updates >= session.max_updates:
+            self.stop()
+
+    def stop(self):
+        session = self.session
+        if session is None:
+            return
+        self.session = None
+        if session.profile is not None:
+            session.profile.disable()
+        else:
+            session.sampler.stop()
+        session.lag.stop()
+        session.timer.cancel()
+        session.elapsed = time.monotonic() - session.started
+        try:
+            session.done.set_result(self.report(session))
+        except Exception as e:
+            session.done.set_exception(e)
+
+    def report(self, session):
+        lines = [
+            f"Профиль за {session.elapsed:.1f} с, апдейтов {session.updates} ({session.describe()})",
+            session.lag.summary(session.elapsed),
+        ]
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        if session.profile is not None:
+            stats = pstats.Stats(session.profile, stream=io.StringIO())
+            for profile in session.thread_profiles:
+                stats.add(profile)
+            stats = stats.stats
+            lines += self.cprofile_top(stats)
+            # Тот же формат, что у pstats.Stats.dump_stats: файл открывается pstats и snakeviz
+            return '\n'.join(lines), f"profile-{stamp}-{os.getpid()}.prof", marshal.dumps(stats)
+        lines += session.sampler.top(self.top)
+        return '\n'.join(lines), f"profile-{stamp}-{os.getpid()}.folded", session.sampler.dump()
+
+    def cprofile_top(self, stats):
+        rows = [
+            (own, total, calls, f"{name} ({short_path(filename)}:{line})")
+            for (filename, line, name), (_, calls, own, total, _) in stats.items()
+            if not is_idle(filename, name)
+        ]
+        lines = ["Больше всего собственного времени (собственное / с вызванными, вызовов):"]
+        for own, total, calls, where in sorted(rows, reverse=True)[:self.top]:
+            lines.append(f"{own * 1000:8.1f} / {total * 1000:8.1f} мс {calls:>7}  {where}")
+        focus = [row for row in rows if row[3].split(' ', 1)[0] in FOCUS_FUNCTIONS]
+        if focus:
+            lines.append("Обработчики, парсеры и Gemini (процессорное время в потоках, без ожидания ответов):")
+            for _, total, calls, where in sorted(focus, key=lambda row: row[1], reverse=True):
+                lines.append(f"{total * 1000:8.1f} мс {calls:>7}  {where}")
+        return lines
+
+    def threaded(self, function):
+        """Обертка функции для asyncio.to_thread: в режиме cpu вызов профилируется в рабочем потоке"""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            session = self.session
+            if session is None or session.profile is None:
+                return function(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: профилировщик сессии уже видит все потоки, второй включить нельзя
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                session.thread_profiles.append(profile)
+        return wrapper
+
+
+def counted(profiler):
+    """Декоратор обработчика апдейтов: считает апдейты, пока идет профилирование"""
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                if profiler.session is not None:
+                    profiler.update_done()
+        return wrapper
+    return decorator
@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+
+logger = logging.getLogger(__name__)
+
+# Чем меньше число, тем раньше запрос уходит при нехватке общего бюджета.
+# Правки уже отправленных сообщений ждут, пока уходят новые ответы
+PRIORITY_SEND = 0
+PRIORITY_EDIT = 1
+ENDPOINT_PRIORITIES = {'editMessageText': PRIORITY_EDIT, 'editMessageReplyMarkup': PRIORITY_EDIT}
+
+
+class TokenBucket:
+    """Бюджет запросов: rate в секунду, запас до burst; резервирование уводит баланс в минус,
+    и каждый следующий запрос ждет свою очередь"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Сколько ждать до следующего запроса без резервирования"""
+        self.refill(now)
+        deficit = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(deficit, self.paused_until - now)
+
+    def reserve(self, now):
+        """Занимаем место и возвращаем, сколько до него ждать"""
+        delay = self.wait_time(now)
+        self.tokens -= 1
+        return delay
+
+    def pause(self, now, seconds):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def idle(self, now):
+        self.refill(now)
+        return self.tokens >= self.burst and self.paused_until <= now
+
+
+class SendScheduler(BaseRateLimiter):
+    """Планировщик исходящих запросов к Bot API.
+
+    Каждый запрос в чат проходит бюджет чата (личные чаты — chat_rate в секунду,
+    группы — group_rate) и общий бюджет бота global_rate. Когда общего бюджета
+    не хватает, запросы ждут в очереди по приоритету: новые сообщения раньше правок.
+    На 429 (RetryAfter) чат или весь бот ставится на паузу и запрос повторяется
+    до max_retries раз."""
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=5, group_rate=20 / 60, group_burst=3,
+                 max_retries=3, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.chats = {}
+        self.queue = []
+        self.sequence = itertools.count()
+        self.dispatcher = None
+        self.counters = {'sent': 0, 'throttled': 0, 'retry_after': 0, 'failed': 0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+
+    def chat_bucket(self, chat_id):
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            if len(self.chats) >= self.max_chats:
+                now = time.monotonic()
+                self.chats = {key: value for key, value in self.chats.items() if not value.idle(now)}
+            # Отрицательный id — группа или канал, у них лимит строже
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chats[chat_id] = bucket
+        return bucket
+
+    def has_budget(self, chat_id):
+        """Можно ли отправить в чат без ожидания — для необязательных правок"""
+        now = time.monotonic()
+        return self.chat_bucket(chat_id).wait_time(now) <= 0 and self.global_bucket.wait_time(now) <= 0
+
+    async def dispatch(self):
+        """Выдаем общий бюджет ожидающим запросам по приоритету"""
+        while self.queue:
+            wait = self.global_bucket.wait_time(time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, waiter = heapq.heappop(self.queue)
+            if not waiter.done():
+                self.global_bucket.reserve(time.monotonic())
+                waiter.set_result(None)
+
+    async def acquire(self, chat_id, priority):
+        throttled = False
+        if chat_id is not None:
+            delay = self.chat_bucket(chat_id).reserve(time.monotonic())
+            if delay > 0:
+                throttled = True
+                await asyncio.sleep(delay)
+
+        if not self.queue and self.global_bucket.wait_time(time.monotonic()) <= 0:
+            self.global_bucket.reserve(time.monotonic())
+        else:
+            throttled = True
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.queue, (priority, next(self.sequence), waiter))
+            if self.dispatcher is None or self.dispatcher.done():
+                self.dispatcher = asyncio.ensure_future(self.dispatch())
+            await waiter
+        if throttled:
+            self.counters['throttled'] += 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if rate_limit_args and 'priority' in rate_limit_args:
+            priority = rate_limit_args['priority']
+        else:
+            priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_SEND)
+
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.counters['retry_after'] += 1
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning(f"Telegram просит подождать {retry_after} с ({endpoint}, чат {chat_id})")
+                bucket = self.chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                bucket.pause(time.monotonic(), retry_after)
+                if attempt == self.max_retries:
+                    self.counters['failed'] += 1
+                    raise
+                continue
+            except Exception:
+                self.counters['failed'] += 1
+                raise
+            self.counters['sent'] += 1
+            return result
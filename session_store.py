@@ -0,0 +1,20 @@
+class SessionStore:
+    """Истории диалогов в общем хранилище состояния (см. state_backend).
+    Реплика хранится компактно — [роль, текст, токены], без служебной инструкции;
+    не больше max_turns реплик, после idle_ttl секунд простоя история забывается.
+    Ограничение числа пользователей в памяти обеспечивает MemoryBackend."""
+
+    def __init__(self, state, idle_ttl, max_turns):
+        self.state = state
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+
+    @staticmethod
+    def key(user_id):
+        return f"session:{user_id}"
+
+    async def history(self, user_id):
+        return await self.state.get(self.key(user_id)) or []
+
+    async def save(self, user_id, turns):
+        await self.state.set(self.key(user_id), turns[-self.max_turns:], ttl=self.idle_ttl)
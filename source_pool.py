@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+
+class SourceHealth:
+    """Скользящая статистика одного хоста: задержки, успехи и состояние предохранителя"""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.results = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def success_rate(self):
+        if not self.results:
+            return 1.0
+        return sum(self.results) / len(self.results)
+
+    def latency_percentile(self, percentile):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * percentile), len(ordered) - 1)
+        return ordered[index]
+
+    def is_open(self, now, cooldown):
+        # После cooldown предохранитель полуоткрыт: хост снова получает пробный запрос
+        return self.opened_at is not None and now - self.opened_at < cooldown
+
+    def record(self, success, latency, now, failure_threshold):
+        self.results.append(success)
+        if success:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.opened_at = None
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= failure_threshold:
+                self.opened_at = now
+
+    def hedge_delay(self, percentile, default, minimum, maximum):
+        """Сколько ждать ответа, прежде чем параллельно спросить следующего: пока замеров мало — default"""
+        delay = default if len(self.latencies) < 5 else self.latency_percentile(percentile)
+        return min(max(delay, minimum), maximum)
+
+
+async def hedged(keys, start, hedge_delay, on_hedge=None):
+    """Хеджированные попытки start(key) по порядку keys: следующая запускается, если текущая
+    не завершилась за hedge_delay(key) или завершилась неудачей (исключением или пустым результатом).
+
+    Возвращает (key, результат) первой удачной попытки, остальные отменяются. Если удачных нет,
+    пробрасывает исключение последней упавшей попытки, а если исключений не было — (None, None).
+    on_hedge(key) вызывается, когда попытка запускается параллельно еще не завершенным."""
+    queue = list(keys)
+    pending = set()
+    launched = {}
+    error = None
+    try:
+        while queue or pending:
+            timeout = None
+            if queue:
+                key = queue.pop(0)
+                if pending and on_hedge is not None:
+                    on_hedge(key)
+                task = asyncio.ensure_future(start(key))
+                launched[task] = key
+                pending.add(task)
+                if queue:
+                    timeout = hedge_delay(key)
+
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task.result():
+                    return launched[task], task.result()
+        if error is not None:
+            raise error
+        return None, None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class SourcePool:
+    """Адаптивный выбор источника: ранжирование по задержке и успешности,
+    предохранители для падающих хостов и хеджированные запросы к следующему источнику"""
+
+    def __init__(self, hedge_percentile=0.9, hedge_delay=2.0, min_hedge_delay=0.2,
+                 max_hedge_delay=10.0, failure_threshold=3, cooldown=300, window=50):
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay_default = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self.hosts = {}
+
+    def health(self, url):
+        host = urlsplit(url).hostname
+        health = self.hosts.get(host)
+        if health is None:
+            health = self.hosts[host] = SourceHealth(self.window)
+        return health
+
+    def rank(self, urls):
+        """Источники от лучшего к худшему; хосты с открытым предохранителем пропускаем"""
+        now = time.monotonic()
+        available = [url for url in urls if not self.health(url).is_open(now, self.cooldown)]
+        if not available:
+            # Все хосты «сломаны» — лучше попробовать, чем сразу сдаться
+            available = list(urls)
+
+        def score(url):
+            health = self.health(url)
+            median = health.latency_percentile(0.5)
+            return (-health.success_rate(), median if median is not None else self.hedge_delay_default)
+
+        # sorted стабилен: у хостов без статистики сохраняется порядок из конфигурации
+        return sorted(available, key=score)
+
+    def hedge_delay(self, url):
+        """Сколько ждать ответа источника, прежде чем параллельно спросить следующий"""
+        return self.health(url).hedge_delay(
+            self.hedge_percentile, self.hedge_delay_default, self.min_hedge_delay, self.max_hedge_delay
+        )
+
+    async def attempt(self, url, fetch_one):
+        start = time.monotonic()
+        try:
+            result = await fetch_one(url)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Ошибка источника {url}: {e}")
+            result = None
+
+        now = time.monotonic()
+        self.health(url).record(bool(result), now - start, now, self.failure_threshold)
+        return result
+
+    async def first(self, urls, fetch_one):
+        """Первый непустой результат fetch_one(url) как (url, результат); остальные запросы отменяются"""
+        return await hedged(
+            self.rank(urls), lambda url: self.attempt(url, fetch_one), self.hedge_delay
+        )
+
+    def snapshot(self):
+        """Состояние хостов для диагностики"""
+        now = time.monotonic()
+        return {
+            host: {
+                'success_rate': health.success_rate(),
+                'p50': health.latency_percentile(0.5),
+                'p90': health.latency_percentile(0.9),
+                'open': health.is_open(now, self.cooldown),
+            }
+            for host, health in self.hosts.items()
+        }
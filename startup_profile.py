@@ -0,0 +1,46 @@
+import contextlib
+import os
+import time
+
+
+def process_age():
+    """Сколько секунд назад запущен процесс (по /proc, только Linux); None, если узнать нельзя"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Имя процесса в скобках может содержать пробелы, поля считаем после него
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """Профиль запуска: время импорта и инициализации каждой части бота
+    и моменты от старта процесса до готовности и первого ответа"""
+
+    def __init__(self):
+        age = process_age()
+        self.started = time.monotonic() - (age or 0.0)
+        self.steps = {}
+        self.milestones = {}
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.steps[name] = self.steps.get(name, 0.0) + time.monotonic() - start
+
+    def mark(self, name):
+        """Момент от старта процесса; записывается только первый раз"""
+        if name not in self.milestones:
+            self.milestones[name] = time.monotonic() - self.started
+        return self.milestones[name]
+
+    def report(self):
+        steps = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.steps.items())
+        milestones = ", ".join(f"{name} {seconds:.2f} с" for name, seconds in self.milestones.items())
+        return f"Запуск: {milestones or 'нет данных'}\nИмпорт и инициализация: {steps or 'нет данных'}"
@@ -0,0 +1,430 @@
+import asyncio
+import inspect
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+
+class MemoryBackend:
+    """Состояние в памяти процесса: не больше max_keys ключей (вытесняются давно
+    не использованные) и срок жизни ключа. Подходит для одного процесса и тестов."""
+
+    name = 'memory'
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        # key -> (значение, момент истечения или None); порядок — от давних к свежим
+        self.data = OrderedDict()
+        self.evicted = 0
+
+    async def get_many(self, keys):
+        now = time.time()
+        values = {}
+        for key in keys:
+            entry = self.data.get(key)
+            if entry is None:
+                continue
+            if entry[1] is not None and entry[1] <= now:
+                del self.data[key]
+                continue
+            self.data.move_to_end(key)
+            values[key] = entry[0]
+        return values
+
+    async def set_many(self, items, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        for key, value in items.items():
+            self.data.pop(key, None)
+            self.data[key] = (value, expires_at)
+        while len(self.data) > self.max_keys:
+            self.data.popitem(last=False)
+            self.evicted += 1
+
+    async def delete_many(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def close(self):
+        pass
+
+    def count(self, prefix):
+        return sum(1 for key in self.data if key.startswith(prefix))
+
+    def stats(self):
+        memory = sys.getsizeof(self.data) + sum(
+            sys.getsizeof(key) + sys.getsizeof(value)
+            for key, (value, _) in self.data.items()
+        )
+        return {'keys': len(self.data), 'memory': memory, 'evicted': self.evicted}
+
+
+class SQLiteBackend:
+    """Состояние в SQLite (WAL): общее для нескольких процессов на одной машине"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS state ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL)'
+            )
+            # Истекшие ключи удаляются при каждой записи: без индекса это был бы просмотр всей таблицы
+            self.conn.execute('CREATE INDEX IF NOT EXISTS state_expires_at ON state (expires_at)')
+            self.conn.commit()
+        return self.conn
+
+    def get_many_sync(self, keys):
+        with self.lock:
+            rows = self.connect().execute(
+                f'SELECT key, value FROM state WHERE key IN ({",".join("?" * len(keys))})'
+                ' AND (expires_at IS NULL OR expires_at > ?)',
+                (*keys, time.time())
+            ).fetchall()
+        return dict(rows)
+
+    def set_many_sync(self, items, ttl):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self.lock:
+            conn = self.connect()
+            conn.executemany(
+                'INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)',
+                [(key, value, expires_at) for key, value in items.items()]
+            )
+            conn.execute('DELETE FROM state WHERE expires_at <= ?', (now,))
+            conn.commit()
+
+    def delete_many_sync(self, keys):
+        with self.lock:
+            conn = self.connect()
+            conn.executemany('DELETE FROM state WHERE key = ?', [(key,) for key in keys])
+            conn.commit()
+
+    def count_sync(self, prefix):
+        # Диапазон по первичному ключу вместо LIKE: поиск идет по индексу
+        with self.lock:
+            (count,) = self.connect().execute(
+                'SELECT COUNT(*) FROM state WHERE key >= ? AND key < ?'
+                ' AND (expires_at IS NULL OR expires_at > ?)',
+                (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1), time.time())
+            ).fetchone()
+        return count
+
+    async def get_many(self, keys):
+        return await asyncio.to_thread(self.get_many_sync, list(keys))
+
+    async def set_many(self, items, ttl=None):
+        await asyncio.to_thread(self.set_many_sync, items, ttl)
+
+    async def delete_many(self, keys):
+        await asyncio.to_thread(self.delete_many_sync, list(keys))
+
+    async def count(self, prefix):
+        return await asyncio.to_thread(self.count_sync, prefix)
+
+    async def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def stats(self):
+        return {}
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """Состояние в Redis (или любом сервере с протоколом RESP): общее для всех воркеров.
+    Команды одной пачки отправляются конвейером за один сетевой обмен."""
+
+    name = 'redis'
+
+    def __init__(self, host, port, db=0, password=None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def encode(command):
+        parts = [f'*{len(command)}\r\n'.encode()]
+        for arg in command:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    async def read_reply(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError('Соединение с Redis закрыто')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            return RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RedisError(f'Неизвестный ответ Redis: {line!r}')
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        if setup:
+            try:
+                await self.send(setup)
+            except BaseException:
+                # Без AUTH или SELECT соединение не годится: следующая попытка подключится заново,
+                # а не станет писать в базу 0
+                self.drop()
+                raise
+
+    async def send(self, commands):
+        self.writer.write(b''.join(self.encode(command) for command in commands))
+        await self.writer.drain()
+        replies = [await self.read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def execute(self, commands):
+        """Выполняем пачку команд конвейером; при обрыве соединения — одна повторная попытка"""
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.writer is None:
+                        await self.connect()
+                    return await self.send(commands)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    self.drop()
+                    if attempt:
+                        raise
+                except asyncio.CancelledError:
+                    # Ответы на отправленные команды не дочитаны — соединение больше не годится
+                    self.drop()
+                    raise
+
+    def drop(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def get_many(self, keys):
+        keys = list(keys)
+        (values,) = await self.execute([('MGET', *keys)])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, items, ttl=None):
+        if ttl:
+            commands = [('SET', key, value, 'PX', int(ttl * 1000)) for key, value in items.items()]
+        else:
+            commands = [('SET', key, value) for key, value in items.items()]
+        await self.execute(commands)
+
+    async def delete_many(self, keys):
+        await self.execute([('DEL', *keys)])
+
+    async def count(self, prefix):
+        """SCAN по шаблону: сервер не блокируется, как при KEYS, но это много обменов — вызывать редко"""
+        pattern = ''.join('\\' + char if char in '*?[]\\' else char for char in prefix) + '*'
+        keys = set()
+        cursor = '0'
+        while True:
+            ((cursor, batch),) = await self.execute([('SCAN', cursor, 'MATCH', pattern, 'COUNT', 1000)])
+            # SCAN может вернуть ключ повторно, поэтому считаем уникальные
+            keys.update(batch)
+            if cursor == '0':
+                return len(keys)
+
+    async def close(self):
+        async with self.lock:
+            self.drop()
+
+    def stats(self):
+        return {}
+
+
+def create_backend(url, max_keys=20000):
+    """memory://, sqlite:///путь/к/файлу.db или redis://[:пароль@]хост:порт/номер_базы"""
+    parts = urlsplit(url)
+    if parts.scheme == 'memory':
+        return MemoryBackend(max_keys)
+    if parts.scheme == 'sqlite':
+        # sqlite:///state.db — относительный путь, sqlite:////var/lib/bot/state.db — абсолютный
+        return SQLiteBackend(unquote(parts.path[1:]))
+    if parts.scheme == 'redis':
+        db = int(parts.path.lstrip('/') or 0)
+        password = unquote(parts.password) if parts.password else None
+        return RedisBackend(parts.hostname or 'localhost', parts.port or 6379, db, password)
+    raise ValueError(f'Неизвестное хранилище состояния: {url}')
+
+
+class StateStore:
+    """Общее состояние бота поверх одного из хранилищ.
+
+    Значения хранятся в JSON. Одновременные чтения и записи из разных апдейтов
+    собираются в одну пачку за итерацию event loop. Для неизменяемых данных
+    (cached=True) есть локальный кэш процесса на cache_ttl секунд.
+    Ключи в общем хранилище считаются в фоне не чаще раза в count_interval секунд."""
+
+    def __init__(self, backend, cache_ttl=60, count_interval=60):
+        self.backend = backend
+        self.cache_ttl = cache_ttl
+        self.count_interval = count_interval
+        self.cache = {}
+        # Префикс -> (число ключей, когда посчитано)
+        self.counts = {}
+        self.counting = set()
+        # Текущие пачки: ключи и future, который завершится после обращения к хранилищу
+        self.read_batch = None
+        self.write_batch = None
+        self.flushes = set()
+        self.counters = {'reads': 0, 'writes': 0, 'batches': 0, 'cache_hits': 0}
+
+    def schedule(self, flush, batch):
+        task = asyncio.ensure_future(flush(batch))
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def flush_reads(self, batch):
+        keys, done = batch
+        self.read_batch = None
+        self.counters['batches'] += 1
+        try:
+            done.set_result(await self.backend.get_many(list(keys)))
+        except Exception as e:
+            done.set_exception(e)
+
+    async def flush_writes(self, batch):
+        items, done = batch
+        self.write_batch = None
+        self.counters['batches'] += 1
+        try:
+            deletes = [key for key, (raw, _) in items.items() if raw is None]
+            by_ttl = {}
+            for key, (raw, ttl) in items.items():
+                if raw is not None:
+                    by_ttl.setdefault(ttl, {})[key] = raw
+            if deletes:
+                await self.backend.delete_many(deletes)
+            for ttl, group in by_ttl.items():
+                await self.backend.set_many(group, ttl)
+            done.set_result(None)
+        except Exception as e:
+            done.set_exception(e)
+
+    async def get_many(self, keys, cached=False):
+        """{ключ: значение} для всех ключей; отсутствующие — None"""
+        now = time.monotonic()
+        values = {}
+        missing = []
+        for key in keys:
+            entry = self.cache.get(key) if cached else None
+            if entry is not None and entry[1] > now:
+                self.counters['cache_hits'] += 1
+                values[key] = entry[0]
+            else:
+                missing.append(key)
+        if not missing:
+            return values
+
+        if self.read_batch is None:
+            self.read_batch = (set(), asyncio.get_running_loop().create_future())
+            self.schedule(self.flush_reads, self.read_batch)
+        batch_keys, done = self.read_batch
+        batch_keys.update(missing)
+        self.counters['reads'] += len(missing)
+
+        raw_values = await asyncio.shield(done)
+        for key in missing:
+            raw = raw_values.get(key)
+            values[key] = json.loads(raw) if raw is not None else None
+            if cached and raw is not None:
+                self.cache[key] = (values[key], now + self.cache_ttl)
+        return values
+
+    async def get(self, key, cached=False):
+        return (await self.get_many([key], cached))[key]
+
+    async def set_many(self, items, ttl=None):
+        """Записываем значения; None удаляет ключ. Поздняя запись ключа в пачке заменяет раннюю"""
+        if self.write_batch is None:
+            self.write_batch = ({}, asyncio.get_running_loop().create_future())
+            self.schedule(self.flush_writes, self.write_batch)
+        batch_items, done = self.write_batch
+        for key, value in items.items():
+            self.cache.pop(key, None)
+            raw = json.dumps(value, ensure_ascii=False) if value is not None else None
+            batch_items[key] = (raw, ttl)
+        self.counters['writes'] += len(items)
+        await asyncio.shield(done)
+
+    async def set(self, key, value, ttl=None):
+        await self.set_many({key: value}, ttl)
+
+    async def delete(self, key):
+        await self.set_many({key: None})
+
+    async def close(self):
+        if self.flushes:
+            await asyncio.gather(*self.flushes, return_exceptions=True)
+        await self.backend.close()
+
+    async def refresh_count(self, prefix):
+        try:
+            self.counts[prefix] = (await self.backend.count(prefix), time.monotonic())
+        finally:
+            self.counting.discard(prefix)
+
+    def count(self, prefix):
+        """Число ключей с префиксом. Общее хранилище считает с запросом, поэтому
+        возвращаем последний подсчет (None до первого) и при необходимости обновляем его в фоне"""
+        if not inspect.iscoroutinefunction(self.backend.count):
+            return self.backend.count(prefix)
+        value, counted_at = self.counts.get(prefix, (None, None))
+        stale = counted_at is None or time.monotonic() - counted_at >= self.count_interval
+        if stale and prefix not in self.counting:
+            self.counting.add(prefix)
+            task = asyncio.ensure_future(self.refresh_count(prefix))
+            self.flushes.add(task)
+            task.add_done_callback(self.flushes.discard)
+        return value
+
+    def stats(self):
+        return {'backend': self.backend.name, **self.counters, **self.backend.stats()}
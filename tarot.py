@@ -0,0 +1,192 @@
+import random
+
+
+# Старшие арканы: (название, картинка, прямое значение, перевернутое значение)
+MAJOR_ARCANA = (
+    ("Шут", "🃏", "Начало чего-то нового. Не бойся рисковать!",
+     "Безрассудство и спешка. Прежде чем прыгать, посмотри под ноги."),
+    ("Маг", "🪄", "У тебя есть все необходимое для успеха. Действуй!",
+     "Силы распылены. Не трать талант на хитрости и пустые обещания."),
+    ("Верховная Жрица", "🌙", "Доверяй своей интуиции. Твой внутренний голос знает ответ.",
+     "Ты не слышишь себя. Отложи суету и вернись к интуиции."),
+    ("Императрица", "👑", "Плодородие и изобилие. Твои усилия принесут результаты.",
+     "Застой и усталость. Позаботься о себе, прежде чем отдавать другим."),
+    ("Император", "⚜️", "Стабильность и контроль. Пора принимать важные решения.",
+     "Жесткость или потеря контроля. Не дави — ищи опору."),
+    ("Иерофант", "📖", "Ищи мудрых советников. Обучение и традиции помогут тебе.",
+     "Чужие правила стали тесны. Пора искать собственный путь."),
+    ("Влюбленные", "💑", "Перед тобой важный выбор. Слушай свое сердце.",
+     "Разлад и сомнения. Не делай выбор из страха."),
+    ("Колесница", "🛡️", "Двигайся вперед к своей цели. Успех в путешествиях.",
+     "Движение буксует. Разберись, куда на самом деле хочешь ехать."),
+    ("Сила", "🦁", "Ты сильнее, чем думаешь. Смелость победит любые страхи.",
+     "Неуверенность в себе. Мягкость сейчас сильнее напора."),
+    ("Отшельник", "🧙", "Время для размышлений. Побыть одному - это хорошо.",
+     "Одиночество затянулось. Пора выйти к людям."),
+    ("Колесо Фортуны", "🎡", "Удача на твоей стороне. Жди приятных сюрпризов.",
+     "Полоса невезения. Она пройдет — не принимай поспешных решений."),
+    ("Справедливость", "⚖️", "Все будет по справедливости. Правда восторжествует.",
+     "Несправедливость или самообман. Будь честен хотя бы с собой."),
+    ("Повешенный", "🙃", "Взгляни на ситуацию по-новому. Иногда нужно просто отпустить.",
+     "Бессмысленное ожидание. Хватит жертвовать собой — действуй."),
+    ("Смерть", "💀", "Конец одного и начало другого. Перемены - это хорошо.",
+     "Ты держишься за то, что уже закончилось. Отпусти."),
+    ("Умеренность", "⚗️", "Соблюдай баланс во всем. Не торопись.",
+     "Перекос и крайности. Верни равновесие."),
+    ("Дьявол", "😈", "Осторожнее с вредными привычками. Не попадись в ловушку.",
+     "Освобождение близко. Ты можешь разорвать старые цепи."),
+    ("Башня", "🏰", "Неожиданные изменения. Старое должно уйти, чтобы пришло новое.",
+     "Перемены откладываются, но не отменяются. Лучше начать их самому."),
+    ("Звезда", "⭐", "Надежда и вера в лучшее. Твои мечты сбудутся.",
+     "Надежда ослабла. Не теряй веры — свет никуда не делся."),
+    ("Луна", "🌕", "Не все так, как кажется. Доверяй своим чувствам.",
+     "Туман рассеивается. Скоро тайное станет явным."),
+    ("Солнце", "☀️", "Радость и успех. Все будет хорошо!",
+     "Радость приглушена. Улыбнись — хорошее все равно рядом."),
+    ("Суд", "👼", "Время подвести итоги. Пришло время для новых начинаний.",
+     "Сомнения и самокритика. Не суди себя слишком строго."),
+    ("Мир", "🌍", "Гармония и завершение. Ты на правильном пути.",
+     "Дело не завершено. Остался последний шаг."),
+)
+
+# Младшие арканы: значение складывается из достоинства карты и сферы ее масти
+SUITS = (
+    ("Жезлов", "🔥", "в делах и начинаниях"),
+    ("Кубков", "🏆", "в любви и отношениях"),
+    ("Мечей", "🗡️", "в мыслях и спорах"),
+    ("Пентаклей", "🪙", "в деньгах и работе"),
+)
+RANKS = (
+    ("Туз", "Новое начало {sphere}. Лови момент!",
+     "Начало откладывается {sphere}. Не торопи события."),
+    ("Двойка", "Выбор и равновесие {sphere}. Взвесь оба варианта.",
+     "Нерешительность {sphere}. Промедление только мешает."),
+    ("Тройка", "Первые плоды {sphere}. Объединяйся с другими.",
+     "Разлад {sphere}. Договорись, прежде чем продолжать."),
+    ("Четверка", "Стабильность {sphere}. Закрепи то, что уже есть.",
+     "Застой {sphere}. Пора выйти из зоны комфорта."),
+    ("Пятерка", "Испытание {sphere}. Трудности временны.",
+     "Худшее позади {sphere}. Можно выдохнуть."),
+    ("Шестерка", "Гармония и поддержка {sphere}. Принимай помощь.",
+     "Неравный обмен {sphere}. Проверь, не отдаешь ли ты слишком много."),
+    ("Семерка", "Проверка на стойкость {sphere}. Стой на своем.",
+     "Сомнения {sphere}. Не распыляйся на мелочи."),
+    ("Восьмерка", "Быстрое движение {sphere}. Все ускоряется.",
+     "Задержки {sphere}. Наберись терпения."),
+    ("Девятка", "Почти у цели {sphere}. Осталось немного.",
+     "Тревога и усталость {sphere}. Дай себе отдых."),
+    ("Десятка", "Завершение цикла {sphere}. Подведи итоги.",
+     "Груз прошлого {sphere}. Отпусти лишнее."),
+    ("Паж", "Новости {sphere}. Будь открыт новому.",
+     "Пустые слухи {sphere}. Не верь всему, что слышишь."),
+    ("Рыцарь", "Решительные шаги {sphere}. Действуй смело.",
+     "Порывистость {sphere}. Сначала подумай, потом делай."),
+    ("Королева", "Мудрость и забота {sphere}. Доверься чутью.",
+     "Капризы и обиды {sphere}. Не принимай все близко к сердцу."),
+    ("Король", "Опыт и власть {sphere}. Ты хозяин положения.",
+     "Упрямство {sphere}. Гибкость сейчас важнее силы."),
+)
+
+# Колода: 78 карт, у каждой номер 0..77; положение карты в раскладе — номер * 2 + перевернута
+DECK = MAJOR_ARCANA + tuple(
+    (f"{rank} {suit}", image, upright.format(sphere=sphere), reversed_.format(sphere=sphere))
+    for suit, image, sphere in SUITS
+    for rank, upright, reversed_ in RANKS
+)
+
+# Завершения для расклада на одну карту
+SINGLE_CARD_ENDINGS = (
+    "Эта карта указывает на важные энергии в твоей жизни сейчас. Прислушайся к интуиции!",
+    "Аркан приносит тебе послание свыше. Задумайся над его значением.",
+    "Карта показывает ключевую тему твоего нынешнего пути.",
+    "Этот аркан раскрывает тайны твоей судьбы в данный момент.",
+    "Мудрость карты поможет тебе найти верное направление.",
+)
+
+
+class Spread:
+    """Расклад: заголовок и подписи позиций; без позиций — одна карта с завершением"""
+
+    def __init__(self, title, positions=None):
+        self.title = title
+        self.positions = positions
+
+    def size(self):
+        return len(self.positions) if self.positions else 1
+
+
+SPREADS = {
+    'one': Spread(None),
+    'three': Spread("📜 **Расклад на три карты**", (
+        "🕰 **Прошлое:**",
+        "⚡ **Настоящее:**",
+        "🔮 **Будущее:**",
+    )),
+    'celtic': Spread("✝️ **Кельтский крест**", (
+        "1️⃣ **Суть ситуации:**",
+        "2️⃣ **Препятствие:**",
+        "3️⃣ **Основа:**",
+        "4️⃣ **Прошлое:**",
+        "5️⃣ **Цель:**",
+        "6️⃣ **Ближайшее будущее:**",
+        "7️⃣ **Ты сам:**",
+        "8️⃣ **Окружение:**",
+        "9️⃣ **Надежды и страхи:**",
+        "🔟 **Итог:**",
+    )),
+}
+
+
+class TarotEngine:
+    """Гадание на Таро из заранее собранных текстов.
+
+    При создании для каждого расклада, позиции, карты и ее положения готовится
+    текст фрагмента, так что расклад — это выбор карт и склейка строк.
+    seed делает последовательность раскладов воспроизводимой."""
+
+    def __init__(self, spreads=SPREADS, reversed_chance=0.3, seed=None):
+        self.spreads = spreads
+        self.reversed_chance = reversed_chance
+        self.rng = random.Random(seed)
+
+        faces = []
+        for name, image, upright, reversed_ in DECK:
+            faces.append((image, name, upright))
+            faces.append((image, f"{name} (перевернутая)", reversed_))
+
+        self.rendered = {}
+        for key, spread in spreads.items():
+            if spread.positions:
+                self.rendered[key] = spread.title + "\n\n", tuple(
+                    tuple(f"{label} {image} {name}\n{meaning}" for image, name, meaning in faces)
+                    for label in spread.positions
+                )
+            else:
+                self.rendered[key] = tuple(
+                    tuple(f"{image} **{name}**\n\n{meaning}\n\n{ending}" for ending in SINGLE_CARD_ENDINGS)
+                    for image, name, meaning in faces
+                )
+
+    def draw(self, count):
+        """Номера положений count разных карт.
+        Карт в раскладе намного меньше, чем в колоде, поэтому повторный выбор
+        при совпадении обходится дешевле random.sample"""
+        random_ = self.rng.random
+        size = len(DECK)
+        drawn = set()
+        faces = []
+        while len(faces) < count:
+            card = int(random_() * size)
+            if card in drawn:
+                continue
+            drawn.add(card)
+            faces.append(card * 2 + (random_() < self.reversed_chance))
+        return faces
+
+    def read(self, spread_key):
+        spread = self.spreads[spread_key]
+        faces = self.draw(spread.size())
+        if not spread.positions:
+            return self.rng.choice(self.rendered[spread_key][faces[0]])
+        title, positions = self.rendered[spread_key]
+        return title + "\n\n".join([texts[face] for texts, face in zip(positions, faces)])
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+
+# Модули бота лежат в корне репозитория, локальный Redis — в benchmarks
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / 'benchmarks')]
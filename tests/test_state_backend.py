@@ -0,0 +1,183 @@
+"""Хранилища состояния: память, SQLite и Redis (локальный FakeRedis из benchmarks).
+
+    python -m pytest tests
+"""
+import asyncio
+import contextlib
+
+import pytest
+
+from fake_redis import FakeRedis
+from state_backend import MemoryBackend, RedisBackend, RedisError, SQLiteBackend, StateStore
+
+
+@contextlib.asynccontextmanager
+async def fake_redis(password=None):
+    redis = FakeRedis(password)
+    server = await redis.start(0)
+    try:
+        yield redis, server.sockets[0].getsockname()[1]
+    finally:
+        redis.drop_clients()
+        server.close()
+        await server.wait_closed()
+
+
+async def check_get_set_delete(backend):
+    await backend.set_many({'a': '1', 'b': '2'})
+    assert await backend.get_many(['a', 'b', 'missing']) == {'a': '1', 'b': '2'}
+    await backend.delete_many(['a'])
+    assert await backend.get_many(['a', 'b']) == {'b': '2'}
+
+
+async def check_ttl(backend):
+    await backend.set_many({'short': '1'}, ttl=0.05)
+    await backend.set_many({'long': '2'}, ttl=60)
+    assert await backend.get_many(['short', 'long']) == {'short': '1', 'long': '2'}
+    await asyncio.sleep(0.1)
+    assert await backend.get_many(['short', 'long']) == {'long': '2'}
+
+
+def test_memory_get_set_delete_and_ttl():
+    async def main():
+        backend = MemoryBackend(max_keys=10)
+        await check_get_set_delete(backend)
+        await check_ttl(backend)
+    asyncio.run(main())
+
+
+def test_memory_evicts_least_recently_used():
+    async def main():
+        backend = MemoryBackend(max_keys=2)
+        await backend.set_many({'a': '1', 'b': '2'})
+        await backend.get_many(['a'])
+        await backend.set_many({'c': '3'})
+        assert await backend.get_many(['a', 'b', 'c']) == {'a': '1', 'c': '3'}
+        assert backend.stats()['evicted'] == 1
+    asyncio.run(main())
+
+
+def test_sqlite_get_set_delete_and_ttl(tmp_path):
+    async def main():
+        backend = SQLiteBackend(str(tmp_path / 'state.db'))
+        try:
+            await check_get_set_delete(backend)
+            await check_ttl(backend)
+        finally:
+            await backend.close()
+    asyncio.run(main())
+
+
+def test_sqlite_shared_between_stores(tmp_path):
+    async def main():
+        path = str(tmp_path / 'state.db')
+        first, second = StateStore(SQLiteBackend(path)), StateStore(SQLiteBackend(path))
+        try:
+            await first.set_many({'session:1': [['user', 'привет', 2]], 'topic:1': True})
+            assert await second.get_many(['session:1', 'topic:1']) == {
+                'session:1': [['user', 'привет', 2]], 'topic:1': True,
+            }
+            await second.delete('topic:1')
+            assert await first.get('topic:1') is None
+            assert await second.backend.count('session:') == 1
+        finally:
+            await first.close()
+            await second.close()
+    asyncio.run(main())
+
+
+def test_redis_get_set_delete_and_ttl():
+    async def main():
+        async with fake_redis() as (_, port):
+            backend = RedisBackend('127.0.0.1', port)
+            try:
+                await check_get_set_delete(backend)
+                await check_ttl(backend)
+                assert await backend.count('b') == 1
+            finally:
+                await backend.close()
+    asyncio.run(main())
+
+
+def test_redis_reconnects_after_drop():
+    async def main():
+        async with fake_redis() as (redis, port):
+            backend = RedisBackend('127.0.0.1', port)
+            try:
+                await backend.set_many({'a': '1'})
+                redis.drop_clients()
+                await asyncio.sleep(0)
+                assert await backend.get_many(['a']) == {'a': '1'}
+            finally:
+                await backend.close()
+    asyncio.run(main())
+
+
+def test_redis_selects_database():
+    async def main():
+        async with fake_redis(password='secret') as (_, port):
+            first = RedisBackend('127.0.0.1', port, db=1, password='secret')
+            second = RedisBackend('127.0.0.1', port, db=2, password='secret')
+            try:
+                await first.set_many({'a': '1'})
+                assert await second.get_many(['a']) == {}
+                assert await first.get_many(['a']) == {'a': '1'}
+            finally:
+                await first.close()
+                await second.close()
+    asyncio.run(main())
+
+
+def test_redis_reconnects_after_failed_auth():
+    async def main():
+        async with fake_redis(password='secret') as (_, port):
+            backend = RedisBackend('127.0.0.1', port, db=1, password='wrong')
+            try:
+                with pytest.raises(RedisError):
+                    await backend.get_many(['a'])
+                # Соединение без AUTH не переиспользуется: следующий вызов подключается заново
+                assert backend.writer is None
+                backend.password = 'secret'
+                await backend.set_many({'a': '1'})
+                assert await backend.get_many(['a']) == {'a': '1'}
+            finally:
+                await backend.close()
+    asyncio.run(main())
+
+
+def test_store_batches_concurrent_reads_and_writes():
+    async def main():
+        store = StateStore(MemoryBackend(max_keys=100))
+        await asyncio.gather(store.set('a', 1), store.set('b', 2), store.set('a', 3))
+        assert store.counters['batches'] == 1
+        values = await asyncio.gather(store.get('a'), store.get('b'), store.get_many(['a', 'missing']))
+        assert values == [3, 2, {'a': 3, 'missing': None}]
+        assert store.counters['batches'] == 2
+    asyncio.run(main())
+
+
+def test_store_cached_reads_skip_backend():
+    async def main():
+        store = StateStore(MemoryBackend(max_keys=100), cache_ttl=60)
+        await store.set('horoscope', {'date': '2026-01-01'})
+        assert await store.get('horoscope', cached=True) == {'date': '2026-01-01'}
+        assert await store.get('horoscope', cached=True) == {'date': '2026-01-01'}
+        assert store.counters['cache_hits'] == 1
+        # Запись сбрасывает локальный кэш
+        await store.set('horoscope', {'date': '2026-01-02'})
+        assert await store.get('horoscope', cached=True) == {'date': '2026-01-02'}
+    asyncio.run(main())
+
+
+def test_store_count_refreshes_in_background():
+    async def main():
+        async with fake_redis() as (_, port):
+            store = StateStore(RedisBackend('127.0.0.1', port), count_interval=60)
+            try:
+                await store.set_many({'session:1': [], 'session:2': [], 'topic:1': True})
+                assert store.count('session:') is None
+                await asyncio.gather(*store.flushes)
+                assert store.count('session:') == 2
+            finally:
+                await store.close()
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов разных чатов (не больше max_concurrent_updates
+    одновременно) и строго последовательная — внутри одного чата.
+
+    Место среди max_concurrent_updates занимается только после lock чата: апдейты,
+    которые ждут свой чат, не отнимают места у других чатов. Семафор PTB берется до
+    do_process_update, поэтому ему передается заведомо большой предел, а настоящий
+    предел — свой семафор slots.
+
+    Порядок сохраняется, потому что asyncio.Lock пропускает ожидающих в порядке
+    очереди, а задачи на апдейты создаются в порядке получения."""
+
+    # Предел для семафора PTB: фактически без ограничения
+    UNLIMITED = 2 ** 30
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(self.UNLIMITED)
+        self.slots = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> [lock, сколько апдейтов этого чата ждут или обрабатываются]
+        self.chat_locks = {}
+
+    @staticmethod
+    def chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+            if update.effective_user is not None:
+                return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.chat_key(update)
+        if key is None:
+            async with self.slots:
+                await coroutine
+            return
+
+        entry = self.chat_locks.get(key)
+        if entry is None:
+            entry = self.chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self.slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.chat_locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
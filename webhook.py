@@ -0,0 +1,88 @@
+"""Режим вебхука: Telegram присылает апдейты по HTTP на ASGI-сервер.
+
+    uvicorn webhook:app --host 0.0.0.0 --port 8000 --workers 4
+
+WEBHOOK_URL — публичный https-адрес, который оканчивается на WEBHOOK_PATH
+(по умолчанию /telegram); если он задан, вебхук регистрируется при запуске.
+WEBHOOK_SECRET (обязателен: 1-256 символов A-Z, a-z, 0-9, _ и -) сверяется
+с заголовком X-Telegram-Bot-Api-Secret-Token; без него сервер не запускается.
+Апдейт подтверждается сразу, а обрабатывается в фоне приложением PTB.
+
+Проверить локально можно, отправив записанный апдейт:
+
+    python benchmarks/post_updates.py benchmarks/fixtures/update_*.json
+"""
+import contextlib
+import hmac
+import logging
+import os
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from telegram import Update
+
+import bot
+
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+application = bot.build_application(polling=False)
+
+
+async def telegram_webhook(request):
+    """Принимаем апдейт, ставим в очередь приложения и сразу отвечаем 200"""
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return Response(status_code=403)
+
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except Exception as e:
+        logger.warning(f"Некорректный апдейт: {e}")
+        return Response(status_code=400)
+
+    await application.update_queue.put(update)
+    return Response()
+
+
+async def healthcheck(request):
+    return PlainTextResponse('ok')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Без секрета кто угодно, узнав адрес, мог бы присылать поддельные апдейты
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не задан: вебхук без проверки секрета не запускается")
+    # Тот же порядок, что и в Application.run_polling
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(
+            WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES
+        )
+    await application.start()
+    try:
+        yield
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+app = Starlette(
+    routes=[
+        Route(WEBHOOK_PATH, telegram_webhook, methods=['POST']),
+        Route('/healthz', healthcheck, methods=['GET']),
+    ],
+    lifespan=lifespan
+)